@@ -1,7 +1,11 @@
+import os
 import chromadb
+from typing import List
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Body
 from fastapi import HTTPException
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 from microservice.track_minutes import *
 from microservice.document_qna import *
@@ -9,13 +13,25 @@ from microservice.web_qna import *
 from microservice.summarisation import *
 from microservice.read_history import *
 from utils.createMongoDocument import initialiseMongoData
-from utils.mongoDBManager import MongoDBManager
-from utils.gptManager import streamGPTQuery
+from utils.mongoDBManager import MongoDBManager, createMongoClient, createIndexes
+from utils.gptManager import streamGPTQuery, openGPTSession, closeGPTSession, responseCacheStats, trackerDecisionStats, embedAgenda
+from utils.chromaDBManager import embeddingCacheStats, flushEmbeddingCache
+from utils.requestScheduler import SingleFlightScheduler
+from utils.chatHistoryCache import chatHistoryCache
+from utils.bm25Index import bm25IndexStats
 
 class BaseRequest(BaseModel):
     minutesID: str
     chatHistoryID: str
 
+class ReadHistoryRequest(BaseModel):
+    minutesID: str
+    chatHistoryID: str
+    before: int = None
+    after: int = None
+    limit: int = None
+    stream: bool = False
+
 class AgendaUpdateRequest(BaseModel):
     agenda: list
     minutesID: str
@@ -62,64 +78,128 @@ class SummarisationRequest(BaseModel):
     chatHistoryID: str
     topicID: str 
 
+class SummariseAllRequest(BaseModel):
+    minutesID: str
+    chatHistoryID: str
+    topicIDs: List[str] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # single pooled MongoClient shared by every request, MongoDBManager is only a view over it
+    app.state.mongoClient = createMongoClient()
+    try:
+        await createIndexes(app.state.mongoClient)
+    except Exception as e:
+        print(f"Unable to create MongoDB indexes due to {e}")
+    # single keep-alive http session for every openai request
+    await openGPTSession()
+    yield
+    await closeGPTSession()
+    flushEmbeddingCache()
+    app.state.mongoClient.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# /track_minutes calls for the same topic are debounced and only the newest one is tracked
+trackMinutesScheduler = SingleFlightScheduler(debounce_ms=int(os.environ.get('TRACK_MINUTES_DEBOUNCE_MS') or 300),
+                                              max_wait_ms=int(os.environ.get('TRACK_MINUTES_MAX_WAIT_MS') or 2000))
+
+
+def getMongoDB(minutesID:str, chatHistoryID:str):
+    """
+        Create a MongoDBManager for the request on top of the application MongoClient
+
+        Args:
+            minutesID (str): minutes document id
+            chatHistoryID (str): chatHistory document id
+
+        Returns:
+            MongoDBManager
+    """
+    return MongoDBManager(minutesID, chatHistoryID, app.state.mongoClient)
 
 
 @app.get("/")
 async def root():
     return{"message": "hello world"}
 
+# Cache metrics of the running service
+@app.get("/metrics")
+async def metrics():
+    return {"embedding_cache": embeddingCacheStats(), "gpt_cache": responseCacheStats(), "track_minutes_scheduler": trackMinutesScheduler.stats(),
+            "trackers": trackerDecisionStats(), "summary_cache": summaryCacheStats(),
+            "chat_history_cache": chatHistoryCache.stats(), "bm25_index": bm25IndexStats()}
+
 # Used to create a new chat history and minutes document
 @app.get("/create")
 async def create_document():
-    return initialiseMongoData()
+    return await initialiseMongoData(app.state.mongoClient)
 
 # All post request will require a minutesID and chatHistoryID to access the database
 
 
 @app.post("/read_history")
-async def handle_read_history(request_body: BaseRequest):
-    return await read_history(request_body.minutesID, request_body.chatHistoryID)
+async def handle_read_history(request_body: ReadHistoryRequest):
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    return await read_history(mongoDB, request_body.before, request_body.after, request_body.limit, request_body.stream)
 
 
 @app.post("/read_glossary")
-def read_glossary(request_body: BaseRequest):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
-    return mongoDB.read_glossary()
+async def read_glossary(request_body: BaseRequest):
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    return await mongoDB.read_glossary()
 
 
 @app.post("/update_agenda")
 async def update_agenda(request_body: AgendaUpdateRequest):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
-    return await mongoDB.update_agenda_meeting(request_body.agenda, True) 
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    #with AGENDA_TRACKER_MODE=vector, the agenda item embeddings are computed once here and stored with the agenda
+    agenda_embeddings = None
+    if (os.environ.get('AGENDA_TRACKER_MODE') or 'llm') == 'vector':
+        try:
+            agenda_embeddings = await embedAgenda(request_body.agenda)
+        except Exception as e:
+            # AgendaTracker embeds the agenda itself when the stored embeddings are missing
+            print(f"Unable to embed agenda due to {e}")
+    return await mongoDB.update_agenda_meeting(request_body.agenda, True, agenda_embeddings) 
 
 
 @app.post("/update_meeting")
 async def update_meeting(request_body: MeetingUpdateRequest):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
     return await mongoDB.update_agenda_meeting(request_body.data, False) 
 
 
 @app.post("/update_glossary")
 async def update_glossary(request_body: GlossaryUpdateRequest):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
     return await mongoDB.update_glossary(request_body.abbreviation, request_body.meaning, request_body.type)
 
 
 @app.post("/track_minutes")
 async def handle_track_minutes(request_body: TrackMinutesRequest):
-    return await track_minutes(request_body.minutes, request_body.topicTitle, request_body.topicID, request_body.minutesID, request_body.chatHistoryID, request_body.abbreviation)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    return await trackMinutesScheduler.submit((request_body.minutesID, request_body.topicID),
+                                              lambda: track_minutes(request_body.minutes, request_body.topicTitle, request_body.topicID, request_body.minutesID, mongoDB, request_body.abbreviation))
 
 
 @app.post("/summarise")
 async def handle_summarisation(request_body: SummarisationRequest):
-    return await summariseText(request_body.minutesID,request_body.chatHistoryID, request_body.topicID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    return await summariseText(mongoDB, request_body.topicID)
+
+
+@app.post("/summarise_all")
+async def handle_summarise_all(request_body: SummariseAllRequest):
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+    return await summariseAll(mongoDB, request_body.topicIDs)
 
 
 @app.post("/delete_topic")
 async def handle_delete_topic(request_body: DeleteTopicRequest):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
     chromaDB = ChromaDBManager(request_body.minutesID)
     status1, status2 = await asyncio.gather(
                                     mongoDB.delete_topic(request_body.topicID), 
@@ -128,32 +208,35 @@ async def handle_delete_topic(request_body: DeleteTopicRequest):
 
 @app.post("/document_query")
 async def handle_document_qna(request_body: QnA):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
     source_ids, formatted_query_message =  await document_qna(request_body.query, mongoDB, request_body.minutesID)
-    return streamGPTQuery(formatted_query_message, user_query=request_body.query, type=request_body.type, request_timeout=5, source_ids=source_ids, mongoDB=mongoDB)
+    return await streamGPTQuery(formatted_query_message, user_query=request_body.query, type=request_body.type, request_timeout=5, source_ids=source_ids, mongoDB=mongoDB)
 
 
 
 @app.post("/web_query")
 async def handle_web_qna(request_body: QnA):
-    mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
+    mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
     formatted_query_message = await web_query(request_body.query, mongoDB)
-    return streamGPTQuery(formatted_query_message, user_query=request_body.query, type=request_body.type, request_timeout=5, mongoDB=mongoDB)
+    return await streamGPTQuery(formatted_query_message, user_query=request_body.query, type=request_body.type, request_timeout=5, mongoDB=mongoDB,
+                                background=BackgroundTask(update_web_memory, mongoDB))
 
 
 
 
 @app.post("/clear")
 async def handle_clear_chat(request_body:ClearChatHistory):
-        mongoDB = MongoDBManager(request_body.minutesID, request_body.chatHistoryID)
-        return await mongoDB.clear_chat_history(request_body.type)
+        mongoDB = getMongoDB(request_body.minutesID, request_body.chatHistoryID)
+        status = await mongoDB.clear_chat_history(request_body.type)
+        chatHistoryCache.invalidate(request_body.chatHistoryID, request_body.type)
+        return status
 
 
 
 ##for our personal use, should never be called by frontend
 @app.post("/delete_document")
 async def handle_delete_document(collectionName: str = Body(...), documentID: str = Body(None), minutesID: str = Body(...), chatHistoryID: str = Body(...)):
-    mongoDB = MongoDBManager(minutesID, chatHistoryID)
+    mongoDB = getMongoDB(minutesID, chatHistoryID)
     chromaDB = ChromaDBManager(minutesID)
     if documentID == None and collectionName == 'minutes':
         documentID = minutesID 
@@ -162,14 +245,18 @@ async def handle_delete_document(collectionName: str = Body(...), documentID: st
     elif documentID == None and collectionName == 'chatHistory':
         documentID = chatHistoryID
     
+    if collectionName == 'chatHistory':
+        chatHistoryCache.invalidate(documentID)
     return await mongoDB.delete_document(documentID, collectionName)
 
 
 @app.post("/delete_collection")
 async def handle_delete_collection(collectionName: str = Body(...), minutesID: str = Body(...), chatHistoryID: str = Body(...)):
-    mongoDB = MongoDBManager(minutesID, chatHistoryID)
+    mongoDB = getMongoDB(minutesID, chatHistoryID)
     chromaDB = ChromaDBManager(minutesID)
     if collectionName == 'minutes':
         chromaDB.delete_collection(minutesID)
+    elif collectionName == 'chatHistory':
+        chatHistoryCache.invalidate()
     return await mongoDB.delete_all_documents(collectionName)
 
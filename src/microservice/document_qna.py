@@ -1,3 +1,4 @@
+import os
 from utils.mongoDBManager import MongoDBManager
 from utils.chromaDBManager import ChromaDBManager
 from utils.formatData import *
@@ -20,16 +21,25 @@ async def document_qna(query:str, mongoDB, minutes_id:str, k:int = 3):
     """
     chromaDB = ChromaDBManager(minutes_id)
 
-    #get chat history
-    chat_history = mongoDB.read_MongoDB('chatHistory', False, None, 'document')
+    #get chat history, only the turns createStandAloneQuery uses
+    chat_history = await mongoDB.read_MongoDB('chatHistory', False, None, 'document', STANDALONE_QUERY_TURNS)
     
     if len(chat_history.get('document', [])) != 0:
         formatted_chat_history = formatChatHistory(chat_history.get('document', []))
         #prepare prompt for openAI
         query = await createStandAloneQuery(formatted_chat_history, query)
 
-    #querying chroma to get the related articles
-    unique_parent_topics, context_dict = await chromaDB.query_collection(query, k)
+    #querying chroma to get the related articles, within DOCUMENT_CONTEXT_TOKENS tokens when set
+    #and only the sentences around the hits when DOCUMENT_CONTEXT_WINDOW is set
+    #DOCUMENT_RETRIEVAL_MODE chooses vector, hybrid (vector + BM25) or lexical (BM25 only, no query embedding) search
+    token_budget = int(os.environ.get('DOCUMENT_CONTEXT_TOKENS') or 0) or None
+    window = os.environ.get('DOCUMENT_CONTEXT_WINDOW')
+    max_distance = os.environ.get('DOCUMENT_MAX_DISTANCE')
+    retrieval = os.environ.get('DOCUMENT_RETRIEVAL_MODE') or 'vector'
+    unique_parent_topics, context_dict = await chromaDB.query_collection(query, k, token_budget,
+                                                                         int(window) if window else None,
+                                                                         float(max_distance) if max_distance else None,
+                                                                         retrieval)
 
     query_message = await documentQuery(query, context_dict)
 
@@ -1,25 +1,72 @@
-from utils.mongoDBManager import MongoDBManager
+import os
+import json
+from starlette.responses import StreamingResponse
+from utils.mongoDBManager import chatHistoryWindow
 
 
-async def read_history(minutes_id:str, chat_history_id: str):
+async def read_history(mongoDB, before:int = None, after:int = None, limit:int = None, stream:bool = False):
     """
     Format chat history from mongoDB and return to client
+    Both document and web history are read with one projection, a page at a time when before / after / limit are given.
+    Turns are numbered from 0 in the order they were appended, cursors returns the range of the page so the client can ask for
+    older turns with before=start or newer turns with after=end-1
 
     Args:
-        minutes_id (str): minutes document id
-        chat_history_id (str): chatHistory document id
+        mongoDB (_type_): mongoDB instance to read chatHistory
+        before (int, optional): only turns older than this sequence number, the newest limit of them
+        after (int, optional): only turns newer than this sequence number, the oldest limit of them
+        limit (int, optional): maximum number of turns per type. Defaults to None (all turns).
+        stream (bool, optional): stream the json, reading READ_HISTORY_PAGE_SIZE turns at a time. Defaults to False.
 
     Returns:
-        dict of list {document: [], web: []}
+        dict of list {document: [], web: [], cursors: {document: {start, end, total}, web: {start, end, total}}}, or a streamingResponse of the same json
     """
-    mongoDB = MongoDBManager(minutes_id, chat_history_id)
+    if stream:
+        return StreamingResponse(stream_history(mongoDB, before, after, limit), media_type='application/json')
 
-    document_chat_history = mongoDB.read_MongoDB('chatHistory', chat_history_type="document")
-    formatted_document_history = format_chat_history(document_chat_history['document'], 'document')
-    web_chat_history = mongoDB.read_MongoDB('chatHistory', chat_history_type="web")
-    formatted_web_history = format_chat_history(web_chat_history['web'], 'web')
-    
-    return {'document': formatted_document_history, 'web': formatted_web_history}
+    pages = await mongoDB.read_chat_history_page(('document', 'web'), before, after, limit)
+    return {'document': format_chat_history(pages['document']['turns'], 'document'),
+            'web': format_chat_history(pages['web']['turns'], 'web'),
+            'cursors': {query_type: {key: page[key] for key in ('start', 'end', 'total')} for query_type, page in pages.items()}}
+
+
+async def stream_history(mongoDB, before:int = None, after:int = None, limit:int = None, page_size:int = None):
+    """
+    Generator of the read_history json, formatted turns are sent as each page is read so memory stays at one page
+
+    Args:
+        mongoDB (_type_): mongoDB instance to read chatHistory
+        before, after, limit: cursors of read_history
+        page_size (int, optional): turns read per query. Defaults to READ_HISTORY_PAGE_SIZE env variable or 100.
+
+    Yields:
+        pieces of the json
+    """
+    if page_size == None:
+        page_size = int(os.environ.get('READ_HISTORY_PAGE_SIZE') or 100)
+
+    # empty page, only to learn the number of turns
+    totals = await mongoDB.read_chat_history_page(('document', 'web'), None, None, 0)
+    cursors = {}
+    yield '{'
+    for i, query_type in enumerate(['document', 'web']):
+        start, end = chatHistoryWindow(totals[query_type]['total'], before, after, limit)
+        cursors[query_type] = {'start': start, 'end': end, 'total': totals[query_type]['total']}
+        yield f'{", " if i else ""}"{query_type}": ['
+
+        separator = ''
+        cursor = start
+        while cursor < end:
+            page = (await mongoDB.read_chat_history_page((query_type,), end, cursor - 1, page_size))[query_type]
+            for formatted_turn in format_chat_history(page['turns'], query_type):
+                yield separator + json.dumps(formatted_turn)
+                separator = ', '
+            if page['end'] <= cursor:
+                break
+            cursor = page['end']
+        yield ']'
+
+    yield f', "cursors": {json.dumps(cursors)}}}'
 
 
 def format_chat_history(chat_history:list, type:str):
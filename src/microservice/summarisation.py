@@ -1,17 +1,45 @@
 import openai
 import os
+import json
+import asyncio
+from starlette.responses import StreamingResponse
 from utils.gptManager import *
 from utils.formatData import *
-from utils.mongoDBManager import MongoDBManager
 
-async def summariseText(minutes_id: str, chat_history_id: str, topic_id: str):
-    
-    openai.api_key = os.environ.get('OPENAI_API_KEY')
+# Summaries served from the topic document (hits) or written by GPT (misses)
+summaryCache = {"hits": 0, "misses": 0}
 
-    mongoDB = MongoDBManager(minutes_id, chat_history_id)
-    
-    content = mongoDB.read_MongoDB('minutes', False, topic_id, None)
+
+def summaryCacheStats():
+    """
+        Function to retrieve the summary cache metrics
+
+        Returns:
+            dictionary of hits, misses and hit ratio
+    """
+    lookups = summaryCache["hits"] + summaryCache["misses"]
+    return {**summaryCache, "hit_ratio": round(summaryCache["hits"] / lookups, 4) if lookups else 0.0}
+
+
+async def summariseText(mongoDB, topic_id: str):
+    content = await mongoDB.read_MongoDB('minutes', False, topic_id, None)
     print(content)
+    return await summariseTopic(content, mongoDB)
+
+
+async def summariseTopic(content: dict, mongoDB):
+    """
+        Function to write the synopsis of one topic
+        The summary is stored on the topic with the hash of the formatted minutes, and served from there while the hash matches
+
+        Args:
+            content (dict): topic in the format {topicID: str, topicTitle: str, sentences: list, summary: str, summaryHash: str}
+            mongoDB (_type_): mongoDB instance to store the summary
+
+        Returns:
+            dictionary in the format {summary: str}
+    """
+    openai.api_key = os.environ.get('OPENAI_API_KEY')
 
     topicTitleExist = topicTitle_match(content['topicTitle'])
     #format minutes into a single string
@@ -21,6 +49,12 @@ async def summariseText(minutes_id: str, chat_history_id: str, topic_id: str):
     if not formatted_minutes.strip():
         return {"summary": "Nothing to summarise."}
 
+    summary_hash = contentHash(formatted_minutes)
+    if content.get('summaryHash') == summary_hash and content.get('summary') != None:
+        summaryCache["hits"] += 1
+        return {"summary": content['summary']}
+    summaryCache["misses"] += 1
+
     #prepare prompt for OpenAI
     query_message=[{"role": "system", "content": 
                     f"""Given a paragraph of topic minutes, your task is to write a sypnosis of the content of the meeting minutes.
@@ -34,5 +68,60 @@ async def summariseText(minutes_id: str, chat_history_id: str, topic_id: str):
     # query_message.append({"role": "user", "content": formatted_minutes})
     
     #query for response and return json format
-    response = await queryGPT(query=query_message, request_timeout=5)
-    return {"summary": response}
\ No newline at end of file
+    response = await queryGPT(query=query_message, request_timeout=5, caller="summariseText")
+    await mongoDB.update_topic_summary(content['topicID'], response, summary_hash)
+    return {"summary": response}
+
+
+async def summariseAll(mongoDB, topic_ids: list = None, concurrency: int = None):
+    """
+        Function for endpoint /summarise_all. Reads every topic in one query and summarises them with bounded concurrency,
+        each summary is sent as a server sent event as soon as it is ready, so the order follows completion and not the minutes
+
+        Args:
+            mongoDB (_type_): mongoDB instance to read the minutes
+            topic_ids (list, optional): topics to summarise. Defaults to None (all topics).
+            concurrency (int, optional): maximum number of summaries in flight. Defaults to SUMMARISE_CONCURRENCY env variable or 5.
+
+        Returns:
+            streamingResponse for fastAPI
+    """
+    if concurrency == None:
+        concurrency = int(os.environ.get('SUMMARISE_CONCURRENCY') or 5)
+    topics = await mongoDB.read_topics(topic_ids)
+    return StreamingResponse(summaryGenerator(topics, mongoDB, concurrency),
+                             media_type='text/event-stream',
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def summaryGenerator(topics: list, mongoDB, concurrency: int):
+    """
+        Generator summarising the topics with at most concurrency summaries in flight
+
+        Args:
+            topics (list): topics from read_topics
+            mongoDB (_type_): mongoDB instance to store the summaries
+            concurrency (int): maximum number of summaries in flight
+
+        Yields:
+            server sent events in the format {topicID: str, summary: str}, {topicID: str, error: str} if a summary failed, then [DONE]
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarise(content):
+        async with semaphore:
+            try:
+                return {"topicID": content['topicID'], **(await summariseTopic(content, mongoDB))}
+            except Exception as e:
+                return {"topicID": content['topicID'], "error": str(getattr(e, 'detail', e))}
+
+    tasks = [asyncio.ensure_future(summarise(content)) for content in topics]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            yield formatServerSentEvent(json.dumps(result), 'error' if 'error' in result else 'summary')
+        yield formatServerSentEvent('[DONE]')
+    finally:
+        # client disconnected, stop the remaining summaries
+        for task in tasks:
+            task.cancel()
@@ -1,73 +1,75 @@
 import asyncio
-from utils.mongoDBManager import MongoDBManager
 from utils.chromaDBManager import ChromaDBManager
 from utils.formatData import *
 from utils.gptManager import *
+from utils.requestScheduler import finishUninterrupted
 
-async def track_minutes(new_minutes:str, topic_title:str, topic_id:str, minutes_id:str, chat_history_id:str, abbreviation:str):
+async def track_minutes(new_minutes:str, topic_title:str, topic_id:str, minutes_id:str, mongoDB, abbreviation:str):
     """
     Function for endpoint /track_minutes. The rough pipeline is as follows:
         1. Format the new minutes to a dictionary
         2. Read from mongoDB
         3. If mongoDB does not contain this topic, create topic and run TopicTracker, AgendaTracker and GlossaryDetector
-        4. If mongoDB does contain this topic, do a comparison to see which minutes are different, update mongoDB and run TopicTracker, AgendaTracker and GlossaryDetector
+        4. If mongoDB does contain this topic, do a line level diff to see which minutes are different, update mongoDB and run TopicTracker, AgendaTracker and GlossaryDetector
+           If nothing changed since the last call (same minutes, title, agenda, abbreviation and glossary), return the stored verdicts instead
+        5. Store the verdicts and the hash of their input on the topic
 
     Args:
         new_minutes (string): minutes on the frontend, where each bulletpoint is split by \n
         topic_title (string): topic title of the topic block minutes reside in
         topic_id (string): topic id of topic block
         minutes_id (string): document id in minutes collection
-        chat_history_id (string): document id in chatHistory collection
+        mongoDB (_type_): mongoDB instance to read and update the minutes
         abbreviation (string): None if no abbreviation, else the abbreviation text
 
     Returns:
-        dictionary in the format {topic: True/False, agenda: True/False, glossary: None or suggested name of abbreviation}
+        dictionary in the format {topic: True/False, agenda: True/False, agendaIndex: None or index of the matching agenda item, glossary: None or suggested name of abbreviation}
     """
     chromaDB = ChromaDBManager(minutes_id)
-    mongoDB = MongoDBManager(minutes_id, chat_history_id)
-    existing_minutes = mongoDB.read_MongoDB('minutes', False, topic_id, None)
+    existing_minutes, existingAgenda, existingGlossary = await asyncio.gather(
+                                            mongoDB.read_MongoDB('minutes', False, topic_id, None),
+                                            mongoDB.read_MongoDB('minutes', True, None, None),
+                                            mongoDB.read_glossary() if abbreviation != None else asyncio.sleep(0)
+                                        )
     formatted_new_minutes =  formatTextMinutes(new_minutes, topic_id)
-
-    existingAgenda = mongoDB.read_MongoDB('minutes', True, None, None)
+    agendaEmbeddings = existingAgenda.get('agendaEmbeddings')
     existingAgenda = existingAgenda['agenda']
+    existingGlossary = (existingGlossary or {}).get('glossary')
+    input_hash = trackerInputHash(new_minutes, topic_title, existingAgenda, abbreviation, existingGlossary)
     
+    new_sentences = list(formatted_new_minutes.values())
     if existing_minutes == None:
         # New topic block
-        Topic, Agenda, Glossary, MongoStatus, ChromaStatus = await asyncio.gather(
-                                                            TopicTracker(new_minutes, topic_title),
-                                                            AgendaTracker(new_minutes, topic_title, existingAgenda),
-                                                            GlossaryDetector(new_minutes, topic_title,abbreviation),
-                                                            mongoDB.update_topic_minutes(formatted_new_minutes, True, topic_id, topic_title),
-                                                            chromaDB.update_embeddings(formatted_new_minutes, topic_id, topic_title)
-                                                        )
-  
+        writes = asyncio.gather(
+                    mongoDB.update_topic_minutes(formatted_new_minutes, True, topic_id, topic_title),
+                    chromaDB.update_embeddings(formatted_new_minutes, topic_id, topic_title, list(formatted_new_minutes.keys()))
+                )
 
     else:
-        formatted_existing_minutes = formatMongoMinutes(existing_minutes['sentences'])
-        update_dict = {}
+        # unchanged lines keep their sentenceID, so only inserted / edited / deleted lines are written and embedded
+        update_dict, sentence_order, moved_positions = diffMinutes(existing_minutes['sentences'], new_minutes, topic_id)
+        if len(update_dict) == 0 and len(moved_positions) == 0 and existing_minutes.get('verdictHash') == input_hash:
+            # unchanged input, no LLM, database write or embedding needed
+            return existing_minutes['verdicts']
+        new_sentences = [sentence for sentence in update_dict.values() if sentence != None]
 
-        for sentenceID in formatted_new_minutes.keys():
-            new_sentence = formatted_new_minutes[sentenceID]
-            old_sentence = formatted_existing_minutes.get(sentenceID, '')
-            if new_sentence != old_sentence:
-                update_dict[sentenceID] = new_sentence
-        
-        
-        if len(formatted_existing_minutes) > len(formatted_new_minutes):
-            i = len(formatted_new_minutes)
-            while i < len(formatted_existing_minutes):
-                update_dict[topic_id + str(i)] = None
-                i += 1
-        
-        Topic, Agenda, Glossary, MongoStatus, ChromaStatus = await asyncio.gather(
-                                                        TopicTracker(new_minutes, topic_title),
-                                                        AgendaTracker(new_minutes, topic_title, existingAgenda),
-                                                        GlossaryDetector(new_minutes, topic_title,abbreviation),
-                                                        mongoDB.update_topic_minutes(update_dict, False, topic_id, topic_title),
-                                                        chromaDB.update_embeddings(update_dict, topic_id, topic_title)
-                                                    )
-    
+        writes = asyncio.gather(
+                    mongoDB.update_topic_minutes(update_dict, False, topic_id, topic_title, sentence_order),
+                    chromaDB.update_embeddings(update_dict, topic_id, topic_title, sentence_order, moved_positions)
+                )
+
+    try:
+        Topic, (Agenda, AgendaIndex), Glossary = await asyncio.gather(
+                                        TopicTracker(new_minutes, topic_title, new_sentences),
+                                        AgendaTracker(new_minutes, topic_title, existingAgenda, agendaEmbeddings),
+                                        GlossaryDetector(new_minutes, topic_title,abbreviation, existingGlossary)
+                                    )
+    finally:
+        # a newer request for the topic cancels the trackers, but the database writes always finish
+        MongoStatus, ChromaStatus = await finishUninterrupted(writes)
 
-    return {"topic": Topic, "agenda": Agenda, "abbreviation": Glossary}
+    verdicts = {"topic": Topic, "agenda": Agenda, "agendaIndex": AgendaIndex, "abbreviation": Glossary}
+    await mongoDB.update_topic_verdicts(topic_id, verdicts, input_hash)
+    return verdicts
 
 
@@ -1,5 +1,8 @@
+import os
+import asyncio
 from utils.formatData import *
 from utils.gptManager import *
+from utils.chatHistoryCache import readFormattedChatHistory
 
 
 async def web_query(question:str, mongoDB):
@@ -13,16 +16,50 @@ async def web_query(question:str, mongoDB):
             String response generated by openai
             updates the database as well
     """
-    chat_history = mongoDB.read_MongoDB('chatHistory', False, None, 'web')
-    print(chat_history)
+    memory_turns = os.environ.get('WEB_MEMORY_TURNS')
+    if memory_turns:
+        # bounded memory, the last turns verbatim and a rolling summary of everything before
+        formattedChatHistory, summary = await asyncio.gather(
+                                                readFormattedChatHistory(mongoDB, 'web', int(memory_turns)),
+                                                mongoDB.read_chat_summary('web')
+                                            )
+        return await webQuery(question, formattedChatHistory, summary['summary'])
 
-    if len(chat_history.get('web', [])) != 0:
-        formattedChatHistory = formatChatHistory(chat_history.get('web', []))
-        print(formattedChatHistory)
-    else:
-        formattedChatHistory = []
+    # every turn is sent to GPT unless WEB_HISTORY_TURNS bounds the context,
+    # only the turns appended since the last question are read and formatted
+    web_history_turns = os.environ.get('WEB_HISTORY_TURNS')
+    formattedChatHistory = await readFormattedChatHistory(mongoDB, 'web', int(web_history_turns) if web_history_turns else None)
 
     # Prepare the list of context to send gpt
     formatted_query = await webQuery(question, formattedChatHistory)
     return formatted_query
 
+
+async def update_web_memory(mongoDB, memory_turns:int = None, batch_turns:int = None):
+    """
+        Fold the web turns that left the verbatim window into the rolling summary, run in the background after each /web_query response
+
+        Args:
+            mongoDB : mongoDB instance for reading and updating the chat history
+            memory_turns (int, optional): turns kept verbatim. Defaults to WEB_MEMORY_TURNS env variable, nothing is done if unset.
+            batch_turns (int, optional): maximum turns folded per call. Defaults to WEB_MEMORY_BATCH_TURNS env variable or 20.
+    """
+    if memory_turns == None:
+        if not os.environ.get('WEB_MEMORY_TURNS'):
+            return
+        memory_turns = int(os.environ['WEB_MEMORY_TURNS'])
+    if batch_turns == None:
+        batch_turns = int(os.environ.get('WEB_MEMORY_BATCH_TURNS') or 20)
+
+    try:
+        summary = await mongoDB.read_chat_summary('web')
+        page = (await mongoDB.read_chat_history_page(('web',), None, summary['end'] - 1, batch_turns))['web']
+        # turns still in the verbatim window stay out of the summary
+        fold_end = min(page['end'], page['total'] - memory_turns)
+        if fold_end <= page['start']:
+            return
+        new_summary = await summariseConversation(summary['summary'], formatChatHistory(page['turns'][:fold_end - page['start']]))
+        await mongoDB.update_chat_summary('web', new_summary, fold_end, summary['end'])
+    except Exception as e:
+        print(f"Unable to update web memory due to {e}")
+
@@ -0,0 +1,127 @@
+import re
+
+# Words an expansion may contain without contributing a letter, eg. Department of Defense (DOD)
+ACRONYM_STOPWORDS = {'of', 'and', 'the', 'for', 'to', 'in', 'on', 'a', 'an', '&', 'de'}
+
+# Phrases written between an abbreviation and its expansion, eg. SLA stands for Service Level Agreement
+DEFINITION_CUES = r"stands for|is short for|short for|is an abbreviation for|abbreviation for|means"
+
+
+def lookupGlossary(abbreviation:str, glossary:list):
+    """
+        Find the abbreviation in the glossary of the meeting
+
+        Args:
+            abbreviation (str): abbreviation to be defined
+            glossary (list): glossary array of the minutes document, in the format [{abbreviation: str, meaning: str}]
+
+        Returns:
+            meaning string or None
+    """
+    for entry in glossary or []:
+        if entry.get('abbreviation', '').strip().lower() == abbreviation.strip().lower() and entry.get('meaning'):
+            return entry['meaning']
+    return None
+
+
+def acronymCandidates(abbreviation:str, text:str):
+    """
+        Find every phrase in the text whose word initials spell the abbreviation.
+        A word may give more than one letter through its inner capitals (PowerPoint -> PP), & matches "and" and stopwords may be skipped
+
+        Args:
+            abbreviation (str): abbreviation to be defined
+            text (str): minutes text
+
+        Returns:
+            list of tuples (start offset, end offset, number of skipped stopwords)
+    """
+    letters = [char.lower() for char in abbreviation if char.isalnum() or char == '&']
+    words = [(match.group(), match.start(), match.end()) for match in re.finditer(r"[A-Za-z0-9][\w'-]*|&", text)]
+    candidates = []
+    if len(letters) == 0:
+        return candidates
+
+    for i in range(len(words)):
+        matched = 0
+        skipped = 0
+        j = i
+        while matched < len(letters) and j < len(words):
+            word = words[j][0]
+            if word.lower() == abbreviation.lower():
+                break
+            if word[0].lower() == letters[matched] or (letters[matched] == '&' and word.lower() in ('and', '&')):
+                matched += 1
+                for char in word[1:]:
+                    if matched < len(letters) and char.isupper() and char.lower() == letters[matched]:
+                        matched += 1
+            elif word.lower() in ACRONYM_STOPWORDS and matched > 0:
+                skipped += 1
+            else:
+                break
+            j += 1
+
+        if matched == len(letters):
+            candidates.append((words[i][1], words[j - 1][2], skipped))
+    return candidates
+
+
+def hasDefinitionCue(abbreviation:str, text:str, start:int, end:int):
+    """
+        Check if text[start:end] is written as the definition of the abbreviation:
+        "Service Level Agreement (SLA)", "SLA (Service Level Agreement)" or "SLA stands for / is short for / means Service Level Agreement"
+
+        Returns:
+            True / False
+    """
+    escaped = re.escape(abbreviation)
+    return bool(re.match(rf"\s*\(\s*{escaped}\s*\)", text[end:])
+                or re.search(rf"{escaped}\s*\(\s*$", text[:start])
+                or re.search(rf"(?<![\w&]){escaped}\s*,?\s*(?:{DEFINITION_CUES})\s*:?\s*$", text[:start], re.IGNORECASE))
+
+
+def scoreAcronymCandidate(abbreviation:str, text:str, start:int, end:int, skipped:int):
+    """
+        Confidence that text[start:end] is the expansion of the abbreviation.
+        Only a written definition (see hasDefinitionCue) can reach the default threshold, capitalised definitions score highest.
+        Phrases whose initials merely spell the abbreviation, eg. "Chris Emailed Olivia" for CEO, stay below it and are left to GPT
+
+        Returns:
+            float score, at most 1
+    """
+    phrase = text[start:end]
+    score = 0.5
+    if hasDefinitionCue(abbreviation, text, start, end):
+        score += 0.35
+        if all(word[0].isupper() or word.lower() in ACRONYM_STOPWORDS for word in phrase.split()):
+            score += 0.15
+    score -= 0.05 * skipped
+    return round(min(score, 1.0), 4)
+
+
+def resolveAcronym(abbreviation:str, text:str, glossary:list = None, min_score:float = 0.85):
+    """
+        Resolve an abbreviation without GPT: the glossary of the meeting first, then the best phrase in the minutes
+
+        Args:
+            abbreviation (str): abbreviation to be defined
+            text (str): minutes text
+            glossary (list, optional): glossary array of the minutes document
+            min_score (float, optional): minimum score for a phrase in the minutes to be accepted. Defaults to 0.85.
+
+        Returns:
+            tuple of (meaning or None, source glossary / minutes or None)
+    """
+    meaning = lookupGlossary(abbreviation, glossary)
+    if meaning != None:
+        return meaning, 'glossary'
+
+    best_score, best_phrase = 0, None
+    for start, end, skipped in acronymCandidates(abbreviation, text):
+        score = scoreAcronymCandidate(abbreviation, text, start, end, skipped)
+        if score > best_score:
+            best_score, best_phrase = score, text[start:end]
+
+    if best_phrase != None and best_score >= min_score:
+        return best_phrase, 'minutes'
+    return None, None
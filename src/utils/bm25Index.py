@@ -0,0 +1,232 @@
+import os
+import re
+import math
+import heapq
+import threading
+from collections import Counter, OrderedDict
+
+# Words that appear in almost every question or sentence and only slow the search down
+BM25_STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does', 'for', 'from', 'has', 'have', 'how', 'i',
+                  'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'we', 'were', 'what', 'when', 'which',
+                  'who', 'will', 'with', 'about', 'our', 'us'}
+
+
+def tokenise(text:str):
+    """
+        Split text into lowercase words without stopwords, "Q3 budget" -> ['q3', 'budget']
+
+        Args:
+            text (str): sentence or query
+
+        Returns:
+            list of words
+    """
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in BM25_STOPWORDS]
+
+
+def reciprocalRankFusion(rankings:list, k:int, constant:int = 60):
+    """
+        Fuse rankings of sentences with reciprocal rank fusion, every ranking adds 1 / (constant + rank) to a sentence
+
+        Args:
+            rankings (list): list of rankings, each a list of tuples (sentenceID, metadata, distance) sorted from the nearest
+            k (int): number of sentences returned
+            constant (int, optional): damping of the top ranks. Defaults to 60.
+
+        Returns:
+            list of tuples (sentenceID, metadata, distance) sorted from the nearest, distance is the negative fused score
+    """
+    scores = {}
+    metadatas = {}
+    for ranking in rankings:
+        for rank, (sentence_id, metadata, distance) in enumerate(ranking):
+            scores[sentence_id] = scores.get(sentence_id, 0) + 1 / (constant + rank + 1)
+            metadatas.setdefault(sentence_id, metadata)
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [(sentence_id, metadatas[sentence_id], -score) for sentence_id, score in best]
+
+
+
+class BM25Index():
+
+    def __init__(self, k1:float = 1.5, b:float = 0.75):
+        """
+            In memory BM25 inverted index of the sentences of one meeting, kept in step with chroma on every write
+            so keyword questions can be answered without embedding the query
+
+            Args:
+                k1 (float, optional): term frequency saturation. Defaults to 1.5.
+                b (float, optional): sentence length normalisation. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.sentences = {}
+        self.postings = {}
+        self.total_length = 0
+
+
+    def _remove(self, sentence_id:str):
+        sentence = self.sentences.pop(sentence_id, None)
+        if sentence == None:
+            return
+        for term in sentence["terms"]:
+            del self.postings[term][sentence_id]
+            if len(self.postings[term]) == 0:
+                del self.postings[term]
+        self.total_length -= sentence["length"]
+
+
+    def upsert(self, sentence_ids:list, sentences:list, metadatas:list):
+        """
+            Add or replace sentences
+
+            Args:
+                sentence_ids (list): list of sentenceIDs
+                sentences (list): list of sentence text
+                metadatas (list): list of chroma metadata, one per sentence
+        """
+        with self.lock:
+            for sentence_id, sentence, metadata in zip(sentence_ids, sentences, metadatas):
+                self._remove(sentence_id)
+                terms = Counter(tokenise(sentence))
+                length = sum(terms.values())
+                self.sentences[sentence_id] = {"metadata": metadata, "terms": terms, "length": length}
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, {})[sentence_id] = frequency
+                self.total_length += length
+
+
+    def delete(self, sentence_ids:list):
+        """
+            Remove sentences
+
+            Args:
+                sentence_ids (list): list of sentenceIDs
+        """
+        with self.lock:
+            for sentence_id in sentence_ids:
+                self._remove(sentence_id)
+
+
+    def delete_topic(self, topic_id):
+        """
+            Remove every sentence of a topic, matching topicID the way the chroma where filter does
+
+            Args:
+                topic_id (str): topicID of the sentences
+        """
+        with self.lock:
+            for sentence_id in [sentence_id for sentence_id, sentence in self.sentences.items() if sentence["metadata"].get('topicID') == topic_id]:
+                self._remove(sentence_id)
+
+
+    def update_positions(self, moved_positions:dict, metadata:dict):
+        """
+            Update the position metadata of sentences that moved without changing
+
+            Args:
+                moved_positions (dict): dictionary in the format of {sentenceID: new index}
+                metadata (dict): dict in the format of {'topicID': topic_id, 'topicTitle': topic_title}
+        """
+        with self.lock:
+            for sentence_id, position in moved_positions.items():
+                if sentence_id in self.sentences:
+                    self.sentences[sentence_id]["metadata"] = {**metadata, 'position': position}
+
+
+    def search(self, query:str, k:int):
+        """
+            Rank the sentences against the query with BM25
+
+            Args:
+                query (str): user query
+                k (int): number of sentences returned
+
+            Returns:
+                list of tuples (sentenceID, metadata, score) sorted from the highest score, sentences without a query word are left out
+        """
+        with self.lock:
+            if len(self.sentences) == 0:
+                return []
+            average_length = self.total_length / len(self.sentences) or 1
+            scores = {}
+            for term in set(tokenise(query)):
+                postings = self.postings.get(term)
+                if postings == None:
+                    continue
+                idf = math.log(1 + (len(self.sentences) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for sentence_id, frequency in postings.items():
+                    length = self.sentences[sentence_id]["length"]
+                    scores[sentence_id] = scores.get(sentence_id, 0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(sentence_id, self.sentences[sentence_id]["metadata"], score) for sentence_id, score in best]
+
+
+    def __len__(self):
+        return len(self.sentences)
+
+
+
+# Process wide LRU of indexes keyed by minutesID, built from chroma the first time a meeting is searched lexically
+bm25Indexes = OrderedDict()
+bm25IndexesLock = threading.Lock()
+BM25_INDEX_SIZE = int(os.environ.get('BM25_INDEX_SIZE') or 64)
+
+
+def getBM25Index(collection_name:str):
+    """
+        Function to retrieve the index of a meeting
+
+        Args:
+            collection_name (str): name of collection (minutesID)
+
+        Returns:
+            BM25Index or None if the meeting was not indexed yet
+    """
+    with bm25IndexesLock:
+        index = bm25Indexes.get(collection_name)
+        if index != None:
+            bm25Indexes.move_to_end(collection_name)
+        return index
+
+
+def setBM25Index(collection_name:str, index:BM25Index):
+    """
+        Function to store the index of a meeting, the least recently used meetings are evicted first
+
+        Args:
+            collection_name (str): name of collection (minutesID)
+            index (BM25Index): index of every sentence of the meeting
+    """
+    with bm25IndexesLock:
+        bm25Indexes[collection_name] = index
+        bm25Indexes.move_to_end(collection_name)
+        while len(bm25Indexes) > BM25_INDEX_SIZE:
+            bm25Indexes.popitem(last=False)
+
+
+def invalidateBM25Index(collection_name:str = None):
+    """
+        Function to drop the index of a deleted collection
+
+        Args:
+            collection_name (str, optional): name of collection to drop. Defaults to None (every index).
+    """
+    with bm25IndexesLock:
+        if collection_name == None:
+            bm25Indexes.clear()
+        else:
+            bm25Indexes.pop(collection_name, None)
+
+
+def bm25IndexStats():
+    """
+        Index metrics
+
+        Returns:
+            dictionary of number of indexed meetings and sentences
+    """
+    with bm25IndexesLock:
+        return {"indexes": len(bm25Indexes), "sentences": sum(len(index) for index in bm25Indexes.values())}
@@ -0,0 +1,129 @@
+import os
+import threading
+from collections import OrderedDict
+from utils.formatData import iterChatHistory
+
+
+class ChatHistoryCache():
+
+    def __init__(self, max_size:int = 256):
+        """
+            Formatted chat history per (chatHistoryID, type), extended with the turns appended since the last read
+            so building the model context only formats and transfers new turns
+
+            Args:
+                max_size (int, optional): maximum number of chat histories kept, least recently used are evicted first. Defaults to 256.
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.formatted_turns = 0
+
+
+    def get(self, key:tuple):
+        """
+            Retrieve the cached entry
+
+            Args:
+                key (tuple): (chatHistoryID, type)
+
+            Returns:
+                tuple of (sequence number the next turn will have, list of formatted messages) or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry == None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["end"], entry["messages"]
+
+
+    def extend(self, key:tuple, start:int, end:int, turns:list, keep:int = None):
+        """
+            Append newly read turns, turns already in the entry are skipped and the entry is replaced if the turns do not continue it
+
+            Args:
+                key (tuple): (chatHistoryID, type)
+                start (int): sequence number of the first turn
+                end (int): sequence number after the last turn
+                turns (list): turns read from mongoDB
+                keep (int, optional): only keep the newest keep messages. Defaults to None (all messages).
+
+            Returns:
+                list of formatted messages
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None and start <= entry["end"] <= end:
+                turns = turns[entry["end"] - start:]
+            else:
+                entry = {"end": start, "messages": []}
+                self.entries[key] = entry
+            entry["messages"].extend(iterChatHistory(turns))
+            if keep != None:
+                del entry["messages"][:-keep]
+            entry["end"] = end
+            self.formatted_turns += len(turns)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return entry["messages"]
+
+
+    def invalidate(self, chat_history_id:str = None, query_type:str = None):
+        """
+            Drop the entries of a chat history, called when it is cleared or deleted
+
+            Args:
+                chat_history_id (str, optional): chatHistory document id. Defaults to None (every chat history).
+                query_type (str, optional): only drop this type. Defaults to None (both types).
+        """
+        with self.lock:
+            for key in list(self.entries.keys()):
+                if (chat_history_id == None or key[0] == chat_history_id) and (query_type == None or key[1] == query_type):
+                    del self.entries[key]
+
+
+    def stats(self):
+        """
+            Cache metrics
+
+            Returns:
+                dictionary of hits, misses, entries and number of turns formatted
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "formatted_turns": self.formatted_turns}
+
+
+
+chatHistoryCache = ChatHistoryCache(int(os.environ.get('CHAT_HISTORY_CACHE_SIZE') or 256))
+
+
+async def readFormattedChatHistory(mongoDB, query_type:str, last_n:int = None):
+    """
+        Function to read the chat history formatted for chatCompletion, only turns appended since the last call are read and formatted
+
+        Args:
+            mongoDB (_type_): mongoDB instance to read chatHistory
+            query_type (str): only web/document
+            last_n (int, optional): only return the messages of the last n turns. Defaults to None (all turns).
+
+        Returns:
+            list of dictionary in the format [{role: user, content: query}, {role: assistant, content: response}, ...]
+    """
+    key = (str(mongoDB.chatHistoryID), query_type)
+    cached = chatHistoryCache.get(key)
+    if cached != None:
+        page = (await mongoDB.read_chat_history_page((query_type,), None, cached[0] - 1, None))[query_type]
+        if page["total"] < cached[0]:
+            # history was cleared since the last read
+            cached = None
+    if cached == None:
+        page = (await mongoDB.read_chat_history_page((query_type,), None, None, last_n))[query_type]
+
+    keep = 2 * last_n if last_n != None else None
+    return list(chatHistoryCache.extend(key, page["start"], page["end"], page["turns"], keep))
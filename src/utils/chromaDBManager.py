@@ -1,50 +1,195 @@
 import os
+import time
+import asyncio
 import chromadb
+from collections import OrderedDict
 from chromadb.utils import embedding_functions
 from fastapi import HTTPException
+from utils.embeddingCache import EmbeddingCache, CachedEmbeddingFunction
+from utils.contextBuilder import buildContext, formatSentences, mergeWindows
+from utils.formatData import sentenceIndex
+from utils.bm25Index import BM25Index, getBM25Index, setBM25Index, invalidateBM25Index, reciprocalRankFusion
+
+
+# Process wide chroma client, embedding function and LRU of collection handles keyed by minutesID
+# so that a request only pays for get_or_create_collection the first time a meeting is seen
+chromaClient = None
+embeddingFunction = None
+collectionCache = OrderedDict()
+COLLECTION_CACHE_SIZE = int(os.environ.get('CHROMADB_COLLECTION_CACHE_SIZE') or 128)
+
+
+def getChromaClient():
+    """
+        Function to retrieve the shared chroma HttpClient, created on first use
+
+        Returns:
+            chromadb HttpClient
+    """
+    global chromaClient
+    if chromaClient == None:
+        chromaClient = chromadb.HttpClient(host=os.environ['CHROMADB_URL'], port=8001)
+    return chromaClient
+
+
+def getEmbeddingFunction():
+    """
+        Function to retrieve the shared OpenAI embedding function, created on first use
+        Embeddings are cached by (model, text) in memory and in a memory-mapped file so repeated text never goes to OpenAI
+
+        Returns:
+            CachedEmbeddingFunction wrapping OpenAIEmbeddingFunction
+    """
+    global embeddingFunction
+    if embeddingFunction == None:
+        model_name = "text-embedding-ada-002"
+        cache = EmbeddingCache(model_name,
+                               memory_size=int(os.environ.get('EMBEDDING_CACHE_SIZE') or 10000),
+                               disk_path=os.environ.get('EMBEDDING_CACHE_DIR') or 'embedding_cache',
+                               disk_size=int(os.environ.get('EMBEDDING_CACHE_DISK_SIZE') or 50000))
+        embeddingFunction = CachedEmbeddingFunction(
+                                embedding_functions.OpenAIEmbeddingFunction(
+                                                    api_key=os.environ['OPENAI_API_KEY'],
+                                                    model_name=model_name
+                                                ),
+                                cache
+                            )
+    return embeddingFunction
+
+
+async def embedSentences(sentences:list):
+    """
+        Function to embed sentences with the embedding function chroma uses.
+        Sentences already upserted into chroma are served by the embedding cache, so only new text goes to OpenAI
+
+        Args:
+            sentences (list): list of sentences
+
+        Returns:
+            list of embeddings
+    """
+    return await asyncio.to_thread(getEmbeddingFunction(), sentences)
+
+
+def embeddingCacheStats():
+    """
+        Function to retrieve the embedding cache metrics
+
+        Returns:
+            dictionary of hit rate, bytes used and eviction counts, empty if no embedding was requested yet
+    """
+    if embeddingFunction == None:
+        return {}
+    return embeddingFunction.cache.stats()
+
+
+def flushEmbeddingCache():
+    """
+        Function to persist the disk tier of the embedding cache, called on shutdown
+    """
+    if embeddingFunction != None:
+        embeddingFunction.cache.flush()
+
+
+def getCollection(collection_name:str):
+    """
+        Function to retrieve a collection handle from the LRU cache, only calling get_or_create_collection on a miss
+
+        Args:
+            collection_name (str): name of collection (minutesID)
+
+        Returns:
+            chromadb Collection
+    """
+    if collection_name in collectionCache:
+        collectionCache.move_to_end(collection_name)
+        return collectionCache[collection_name]
+
+    collection = getChromaClient().get_or_create_collection(collection_name, embedding_function=getEmbeddingFunction())
+    collectionCache[collection_name] = collection
+    if len(collectionCache) > COLLECTION_CACHE_SIZE:
+        collectionCache.popitem(last=False)
+    return collection
+
+
+def invalidateCollection(collection_name:str = None):
+    """
+        Function to remove collection handles from the LRU cache once the collection is deleted
+
+        Args:
+            collection_name (str, optional): name of collection to remove. Defaults to None (removes all handles).
+    """
+    if collection_name == None:
+        collectionCache.clear()
+    else:
+        collectionCache.pop(collection_name, None)
+
+
+
+def sentencePosition(sentence_id:str, metadata:dict):
+    """
+        Function to retrieve the index of a sentence within its topic.
+        Sentences written before positions were stored use the index encoded in their sentenceID (see sentenceIndex)
+
+        Args:
+            sentence_id (str): id of the sentence
+            metadata (dict): metadata of the sentence
+
+        Returns:
+            int index of the sentence
+    """
+    if 'position' in metadata:
+        return metadata['position']
+    return sentenceIndex(sentence_id, metadata['topicID']) or 0
 
 
 
 class ChromaDBManager():
 
     def __init__(self, collection_name:str):
-        self.chromaDB = chromadb.HttpClient(host=os.environ['CHROMADB_URL'], port=8001)
+        self.chromaDB = getChromaClient()
         self.collection_name = collection_name
-        self.embeddingFunction = embedding_functions.OpenAIEmbeddingFunction(
-                                                                    api_key=os.environ['OPENAI_API_KEY'],
-                                                                    model_name="text-embedding-ada-002"
-                                                                )
-        self.minutesCollection = self.chromaDB.get_or_create_collection(self.collection_name, embedding_function=self.embeddingFunction)
+        self.embeddingFunction = getEmbeddingFunction()
+        self.minutesCollection = getCollection(self.collection_name)
+        self.query_timings = {}
 
 
-    async def update_embeddings(self, update_list:dict, topic_id: str, topic_title:str):
+    async def update_embeddings(self, update_list:dict, topic_id: str, topic_title:str, sentence_order:list = None, moved_positions:dict = None):
         """
             Function to update vector embeddings inside chrome
 
             Args:
                 update_list (dict): dictionary in the format of {sentenceID: sentenceText} that needs to be updated, will be {sentenceID: None} if to be deleted
                 topic_id (str): string containing the topic id, will be the metadata (defines the parent document)
+                topic_title (str): string containing the topic title, will be the metadata
+                sentence_order (list, optional): sentenceIDs of the topic in order, stored as the position metadata. Defaults to None.
+                moved_positions (dict, optional): {sentenceID: new index} of unchanged sentences that moved, only their metadata is updated (no embedding). Defaults to None.
 
             Returns:
                 dictionary of status 200
         """
         meta_data = {'topicID': topic_id, 'topicTitle': topic_title if topic_title!= None else 'No Title'}
+        positions = {sentenceID: index for index, sentenceID in enumerate(sentence_order)} if sentence_order != None else {}
         update_sentenceID = []
         update_sentenceText = []
+        update_metadata = []
         delete_sentenceID = []
 
         for sentenceID, sentenceText in update_list.items():
             if sentenceText != None:
                 update_sentenceID.append(sentenceID)
                 update_sentenceText.append(sentenceText)
+                update_metadata.append({**meta_data, 'position': positions[sentenceID]} if sentenceID in positions else meta_data)
             
             else:
                 delete_sentenceID.append(sentenceID)
         try:
             if len(update_sentenceID) > 0:
-                await self.upsert_embedding(update_sentenceID, update_sentenceText, meta_data)
+                await self.upsert_embedding(update_sentenceID, update_sentenceText, update_metadata)
             if len(delete_sentenceID) > 0:
                 await self.delete_embedding(delete_sentenceID)
+            if moved_positions:
+                await self.update_positions(moved_positions, meta_data)
             return {'status': 200}
     
         except Exception as e:
@@ -53,24 +198,46 @@ class ChromaDBManager():
 
 
 
-    async def upsert_embedding(self, sentenceID:list, sentenceText:list, metadata:dict):
+    async def upsert_embedding(self, sentenceID:list, sentenceText:list, metadata:list):
         """
             Function to upsert embeddings
 
             Args:
                 sentenceID (list): list of ids(str) to be updated
                 sentenceText (list): list of sentence text (str) to be updated
-                metadata (dict): dict in the format of {'topicID': topic_id}
+                metadata (list): list of dict in the format of {'topicID': topic_id, 'topicTitle': topic_title, 'position': index}, one per sentence
         """
         try:
             self.minutesCollection.upsert(ids= sentenceID, 
-                            metadatas= [metadata for i in range(len(sentenceID))],
+                            metadatas= metadata,
                             documents= sentenceText)
+            index = getBM25Index(self.collection_name)
+            if index != None:
+                index.upsert(sentenceID, sentenceText, metadata)
             return {'status': 200}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Unable to update database due to {e}")
 
 
+    async def update_positions(self, moved_positions:dict, metadata:dict):
+        """
+            Function to update the position metadata of sentences that moved without changing, their embeddings are kept
+
+            Args:
+                moved_positions (dict): dictionary in the format of {sentenceID: new index}
+                metadata (dict): dict in the format of {'topicID': topic_id, 'topicTitle': topic_title}
+        """
+        try:
+            self.minutesCollection.update(ids= list(moved_positions.keys()),
+                            metadatas= [{**metadata, 'position': position} for position in moved_positions.values()])
+            index = getBM25Index(self.collection_name)
+            if index != None:
+                index.update_positions(moved_positions, metadata)
+            return {'status': 200}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Unable to update positions due to {e}")
+
+
     
     async def delete_embedding(self, deletedIDs:list):
         """
@@ -81,6 +248,9 @@ class ChromaDBManager():
         """
         try:
             self.minutesCollection.delete(ids = deletedIDs)
+            index = getBM25Index(self.collection_name)
+            if index != None:
+                index.delete(deletedIDs)
             return {'status': 200}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Unable to delete embedding due to {e}")
@@ -95,49 +265,169 @@ class ChromaDBManager():
         """
         try:
             self.minutesCollection.delete(where= {"topicID": topicID})
+            index = getBM25Index(self.collection_name)
+            if index != None:
+                index.delete_topic(topicID)
             return {'status': 200}
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Unable to delete topic due to {e}")
 
 
-    async def query_collection(self, query:str, k:int):
+    def lexical_index(self):
+        """
+        Function to retrieve the BM25 index of the collection, built from every sentence in chroma the first time the meeting is searched lexically.
+        Later writes through this class keep it up to date
+
+        Returns:
+            BM25Index
+        """
+        index = getBM25Index(self.collection_name)
+        if index == None:
+            all_documents = self.minutesCollection.get(include=['metadatas', 'documents'])
+            index = BM25Index()
+            index.upsert(all_documents['ids'], all_documents['documents'], all_documents['metadatas'])
+            setBM25Index(self.collection_name, index)
+        return index
+
+
+    def lexical_hits(self, query:str, k:int):
+        """
+        Function to search the BM25 index, no embedding of the query is needed
+
+        Args:
+            query (str): user query
+            k (int): query will return top k results
+
+        Returns:
+            list of tuples (sentenceID, metadata, distance) sorted from the nearest, distance is the negative BM25 score
+        """
+        return [(sentence_id, metadata, -score) for sentence_id, metadata, score in self.lexical_index().search(query, k)]
+
+
+    def get_windows(self, hits:list, window:int):
+        """
+        Function to fetch the sentences within window positions of every hit, overlapping windows of a topic are merged first.
+        Sentences with a position metadata are filtered on it in one request, older sentences are fetched by their sentenceID,
+        built in the same format ("{topicID}-{index}" or the undelimited "{topicID}{index}") as the hit
+
+        Args:
+            hits (list): list of tuples (sentenceID, metadata, distance)
+            window (int): number of sentences kept on each side of a hit
+
+        Returns:
+            chroma get result with ids, documents and metadatas
+        """
+        spans = {}
+        for sentence_id, metadata, distance in hits:
+            position = sentencePosition(sentence_id, metadata)
+            delimiter = '-' if sentence_id.startswith(f"{metadata['topicID']}-") else ''
+            spans.setdefault((metadata['topicID'], 'position' in metadata, delimiter), []).append((max(position - window, 0), position + window))
+
+        position_filters = []
+        window_ids = []
+        for (topic_id, has_position, delimiter), topic_spans in spans.items():
+            for low, high in mergeWindows(topic_spans):
+                if has_position:
+                    position_filters.append({"$and": [{"topicID": topic_id}, {"position": {"$gte": low}}, {"position": {"$lte": high}}]})
+                else:
+                    window_ids += [f"{topic_id}{delimiter}{position}" for position in range(low, high + 1)]
+
+        requests = []
+        if len(position_filters) > 0:
+            requests.append({'where': position_filters[0] if len(position_filters) == 1 else {"$or": position_filters}})
+        if len(window_ids) > 0:
+            requests.append({'ids': window_ids})
+
+        documents = {'ids': [], 'documents': [], 'metadatas': []}
+        for request in requests:
+            fetched = self.minutesCollection.get(**request, include=['metadatas', 'documents'])
+            for key in documents:
+                documents[key] += fetched[key]
+        return documents
+
+
+    async def query_collection(self, query:str, k:int, token_budget:int = None, window:int = None, max_distance:float = None, retrieval:str = 'vector'):
         """
         Function to query the database and retrieve context for document qna
 
         Args:
             query (str): user query
             k (int): query will return top k results
+            token_budget (int, optional): maximum number of context tokens, the context is built around the hits by buildContext. Defaults to None (every fetched sentence).
+            window (int, optional): only fetch the sentences within window positions of a hit. Defaults to None (every sentence of the topics).
+            max_distance (float, optional): similarity search hits further than this distance are dropped. Defaults to None (every hit is kept).
+            retrieval (str, optional): vector (similarity search), lexical (BM25 only, no embedding of the query) or hybrid (both fused with reciprocal rank fusion). Defaults to 'vector'.
 
         Returns:
             unique_parent_topics (list): list of topics that are use for context
             context_dict (dict): dictionary {topicID: topicMinutes}
+            timings of the similarity search and topic reconstruction are kept in self.query_timings
         """
         try:
-            results = self.minutesCollection.query(query_texts=query,
-                                                n_results=k,
-                                                include=['metadatas'])
-            
-            print(results)
-            all_parent_topics = [data['topicID'] for sublist in results['metadatas'] for data in sublist]
-            unique_parent_topics = list(set(all_parent_topics))
+            search_start = time.perf_counter()
+            if retrieval == 'lexical':
+                hits = self.lexical_hits(query, k)
+            else:
+                #hybrid search fuses twice as many candidates of each ranking
+                candidates = k if retrieval != 'hybrid' else 2 * k
+                results = self.minutesCollection.query(query_texts=query,
+                                                    n_results=candidates,
+                                                    include=['metadatas', 'distances'])
+                
+                print(results)
+                hits = [(sentence_id, data, distance) for ids, metadatas, distances in zip(results['ids'], results['metadatas'], results['distances'])
+                                                      for sentence_id, data, distance in zip(ids, metadatas, distances)
+                                                      if max_distance == None or distance <= max_distance]
+                if retrieval == 'hybrid':
+                    hits = reciprocalRankFusion([hits, self.lexical_hits(query, candidates)], k)
+            unique_parent_topics = list(set(data['topicID'] for sentence_id, data, distance in hits))
             
-            #getting all parent ids
+            reconstruction_start = time.perf_counter()
             context_dict = {}
-            for parentID in unique_parent_topics:
-                all_child_documents = self.minutesCollection.get(where={"topicID": parentID})
-
-                #get topic title
-                topic_title = all_child_documents['metadatas'][0]['topicTitle']
-                #sort sentences into order by using sentenceID
-                zipped_id_document = list(zip(all_child_documents['ids'], all_child_documents['documents']))
-                sorted_id_document = sorted(zipped_id_document, key=lambda x: int(x[0]))
-                #retrieve document
-                topic_minutes = ''
-                for item in sorted_id_document:
-                    topic_minutes += f"{item[1]}\n"
-
-                context_dict[topic_title] = topic_minutes
+            context_tokens = None
+            fetched_sentences = 0
+            if len(unique_parent_topics) > 0:
+                if window == None:
+                    #getting all sentences of every parent topic in one request
+                    all_child_documents = self.minutesCollection.get(where={"topicID": {"$in": unique_parent_topics}},
+                                                                     include=['metadatas', 'documents'])
+                else:
+                    all_child_documents = self.get_windows(hits, window)
+                fetched_sentences = len(all_child_documents['ids'])
+
+                #group sentences by topic in a single pass
+                topic_titles = {}
+                topic_sentences = {}
+                for sentence_id, document, metadata in zip(all_child_documents['ids'], all_child_documents['documents'], all_child_documents['metadatas']):
+                    topic_titles.setdefault(metadata['topicID'], metadata['topicTitle'])
+                    topic_sentences.setdefault(metadata['topicID'], {})[sentence_id] = (sentencePosition(sentence_id, metadata), document)
+
+                topics = {}
+                sentence_index = {}
+                for parentID in unique_parent_topics:
+                    if parentID not in topic_sentences:
+                        continue
+                    #sort sentences into order by using their position, a whole topic has no gaps
+                    sorted_id_document = sorted(topic_sentences[parentID].items(), key=lambda x: x[1][0])
+                    topics[parentID] = {"title": topic_titles[parentID],
+                                        "sentences": [(index if window == None else position, document) for index, (sentence_id, (position, document)) in enumerate(sorted_id_document)]}
+                    sentence_index.update((sentence_id, index) for index, (sentence_id, position_document) in enumerate(sorted_id_document))
+
+                if token_budget:
+                    topic_hits = [(data['topicID'], sentence_index[sentence_id], distance) for sentence_id, data, distance in hits if sentence_id in sentence_index]
+                    context_dict, context_tokens = buildContext(topics, topic_hits, token_budget)
+                else:
+                    for topic in topics.values():
+                        context_dict[topic["title"]] = formatSentences(topic["sentences"])
+
+            end = time.perf_counter()
+            self.query_timings = {'retrieval': retrieval,
+                                  'search_ms': round((reconstruction_start - search_start) * 1000, 2),
+                                  'reconstruction_ms': round((end - reconstruction_start) * 1000, 2),
+                                  'fetched_sentences': fetched_sentences,
+                                  'context_tokens': context_tokens}
+            print(f"query_collection timings: {self.query_timings}")
 
             return unique_parent_topics, context_dict
 
@@ -159,6 +449,8 @@ class ChromaDBManager():
                 dict of status 200
         """
         try:
+            invalidateCollection(collection_name)
+            invalidateBM25Index(collection_name)
             self.chromaDB.delete_collection(collection_name)
             return {'status': 200}
         except Exception as e:
@@ -199,6 +491,8 @@ class ChromaDBManager():
             collection_list = self.list_collection()
             for collection_name in collection_list:
                 self.delete_collection(collection_name.name)
+            invalidateCollection()
+            invalidateBM25Index()
             return {'status': 200}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Unable to delete database due to {e}")
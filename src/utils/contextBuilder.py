@@ -0,0 +1,172 @@
+import time
+import tiktoken
+
+# Tokenizer of the model documentQuery is sent to
+CONTEXT_MODEL = 'gpt-3.5-turbo'
+encoding = None
+# A failed load is retried after a delay that doubles up to ENCODING_RETRY_MAX_SECONDS
+ENCODING_RETRY_SECONDS = 30
+ENCODING_RETRY_MAX_SECONDS = 3600
+encodingRetryAt = 0
+encodingRetryDelay = ENCODING_RETRY_SECONDS
+
+
+def getEncoding():
+    """
+        Function to retrieve the tiktoken encoding of CONTEXT_MODEL, loaded on first use.
+        tiktoken downloads the encoding once, while that is not possible tokens are estimated from the number of characters
+        and the load is retried with an exponential backoff, only a successful load is cached
+
+        Returns:
+            tiktoken Encoding or None when unavailable
+    """
+    global encoding, encodingRetryAt, encodingRetryDelay
+    if encoding == None and time.monotonic() >= encodingRetryAt:
+        try:
+            encoding = tiktoken.encoding_for_model(CONTEXT_MODEL)
+            encodingRetryDelay = ENCODING_RETRY_SECONDS
+        except Exception as e:
+            print(f"tiktoken encoding unavailable, estimating tokens from characters and retrying in {encodingRetryDelay}s: {e}")
+            encodingRetryAt = time.monotonic() + encodingRetryDelay
+            encodingRetryDelay = min(encodingRetryDelay * 2, ENCODING_RETRY_MAX_SECONDS)
+    return encoding
+
+
+def countTokens(text:str):
+    """
+        Number of tokens of the text for CONTEXT_MODEL
+
+        Args:
+            text (str): text to be counted
+
+        Returns:
+            int number of tokens
+    """
+    current_encoding = getEncoding()
+    if current_encoding != None:
+        return len(current_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def topicHeader(topic_title:str):
+    """
+        Header written before the sentences of a topic, in the format documentQuery uses
+    """
+    return f"Topic Title: {topic_title}\n"
+
+
+def mergeWindows(windows:list):
+    """
+        Merge overlapping or adjacent sentence windows
+
+        Args:
+            windows (list): list of tuples (lowest position, highest position)
+
+        Returns:
+            list of merged tuples (lowest position, highest position) sorted by position
+    """
+    merged = []
+    for low, high in sorted(windows):
+        if len(merged) > 0 and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def formatSentences(sentences:list, selected:set = None):
+    """
+        Write the sentences of a topic one per line, with "..." where positions were left out
+
+        Args:
+            sentences (list): list of tuples (position, sentence) sorted by position
+            selected (set, optional): indices of the sentences to write. Defaults to None (every sentence).
+
+        Returns:
+            topic text
+    """
+    text = ''
+    previous = -1
+    for index, (position, sentence) in enumerate(sentences):
+        if selected != None and index not in selected:
+            continue
+        if position != previous + 1:
+            text += "...\n"
+        text += f"{sentence}\n"
+        previous = position
+    return text
+
+
+def buildContext(topics:dict, hits:list, token_budget:int):
+    """
+        Assemble the context of documentQuery within a token budget.
+        Hit sentences are added from the nearest to the furthest, then every hit is grown one neighbouring sentence at a time
+        on each side (nearest hit first) until the budget is used up or the topics are complete.
+        Sentences are written in their order within the topic, with "..." where sentences were left out,
+        the markers are counted against the budget as sentences open or close gaps
+
+        Args:
+            topics (dict): {topicID: {"title": topic title, "sentences": list of tuples (position, sentence) sorted by position}}
+            hits (list): list of tuples (topicID, index of the sentence in the topic, distance)
+            token_budget (int): maximum number of context tokens
+
+        Returns:
+            context_dict (dict): {topic_title: topic_details}, topics ordered by their nearest hit
+            used_tokens (int): number of tokens of the assembled context
+    """
+    selected = {}
+    used_tokens = 0
+    marker_tokens = countTokens("...\n")
+
+    def marker(sentences, index, previous):
+        # formatSentences writes "..." before a sentence that does not follow the previous written one
+        return int(sentences[index][0] != (sentences[previous][0] if previous != None else -1) + 1)
+
+    def take(topic_id, index):
+        nonlocal used_tokens
+        if index in selected.get(topic_id, ()):
+            return True
+        sentences = topics[topic_id]['sentences']
+        cost = countTokens(f"{sentences[index][1]}\n")
+        if topic_id not in selected:
+            cost += countTokens(topicHeader(topics[topic_id]['title'])) + 1
+        previous = max((i for i in selected.get(topic_id, ()) if i < index), default=None)
+        following = min((i for i in selected.get(topic_id, ()) if i > index), default=None)
+        markers = marker(sentences, index, previous)
+        if following != None:
+            markers += marker(sentences, following, index) - marker(sentences, following, previous)
+        cost += markers * marker_tokens
+        if used_tokens + cost > token_budget:
+            return False
+        selected.setdefault(topic_id, set()).add(index)
+        used_tokens += cost
+        return True
+
+    # [topicID, lowest index, highest index, can grow left, can grow right] per hit
+    windows = []
+    for topic_id, index, distance in sorted(hits, key=lambda hit: hit[2]):
+        if topic_id in topics and 0 <= index < len(topics[topic_id]['sentences']) and take(topic_id, index):
+            windows.append([topic_id, index, index, True, True])
+
+    growing = True
+    while growing:
+        growing = False
+        for window in windows:
+            topic_id = window[0]
+            if window[3]:
+                window[3] = window[1] > 0 and take(topic_id, window[1] - 1)
+                if window[3]:
+                    window[1] -= 1
+            if window[4]:
+                window[4] = window[2] < len(topics[topic_id]['sentences']) - 1 and take(topic_id, window[2] + 1)
+                if window[4]:
+                    window[2] += 1
+            growing = growing or window[3] or window[4]
+
+    context_dict = {}
+    used_tokens = 0
+    for topic_id in selected:
+        text = formatSentences(topics[topic_id]['sentences'], selected[topic_id])
+        context_dict[topics[topic_id]['title']] = text
+        used_tokens += countTokens(f"{topicHeader(topics[topic_id]['title'])}{text}\n")
+    return context_dict, used_tokens
@@ -1,19 +1,16 @@
-import os
-import pymongo
 import datetime
 from fastapi import HTTPException
 
-def initialiseMongoData():
+async def initialiseMongoData(client):
     """
     Function to create a new document for the minutes and chatHistory collection
 
-    Args: None
+    Args:
+        client (AsyncIOMotorClient): application MongoClient created with createMongoClient
 
     Res: dictionary of minutes collection ID and chatHistory collection ID
     """
     try:
-        mongoDB_url = f"mongodb://{os.environ['MONGODB_USERNAME']}:{os.environ['MONGODB_PASSWORD']}@{os.environ['MONGODB_URL']}"
-        client = pymongo.MongoClient(mongoDB_url)
         database = client['document_db']
 
         base_minutes_template = { "agenda": [],
@@ -28,8 +25,8 @@ def initialiseMongoData():
 
         base_chatHistory_template = { "document": [], "web": []}
 
-        minutes_result = database.minutes.insert_one(base_minutes_template)
-        chat_result = database.chatHistory.insert_one(base_chatHistory_template)
+        minutes_result = await database.minutes.insert_one(base_minutes_template)
+        chat_result = await database.chatHistory.insert_one(base_chatHistory_template)
 
         if minutes_result.inserted_id and chat_result.inserted_id:
             print(f"minute_id: {minutes_result.inserted_id}")
@@ -43,4 +40,6 @@ def initialiseMongoData():
 
 
 if __name__ == "__main__":
-    initialiseMongoData()
\ No newline at end of file
+    import asyncio
+    from utils.mongoDBManager import createMongoClient
+    asyncio.run(initialiseMongoData(createMongoClient()))
\ No newline at end of file
@@ -0,0 +1,294 @@
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from chromadb.api.types import EmbeddingFunction
+
+
+def normaliseText(text:str):
+    """
+        Normalise text before hashing so that whitespace or unicode form differences do not cause a cache miss
+
+        Args:
+            text (str): sentence to be embedded
+
+        Returns:
+            normalised string
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embeddingKey(model_name:str, text:str):
+    """
+        Content address of an embedding, hash of (model, normalised text)
+
+        Args:
+            model_name (str): name of the embedding model
+            text (str): sentence to be embedded
+
+        Returns:
+            hex digest string
+    """
+    return hashlib.sha256(f"{model_name}\0{normaliseText(text)}".encode("utf-8")).hexdigest()
+
+
+
+def keyDigest(key:str):
+    """
+        Fixed size digest of a cache key, stored next to the vector of every disk slot to record which key owns it
+
+        Args:
+            key (str): key from embeddingKey
+
+        Returns:
+            32 bytes
+    """
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+
+class EmbeddingCache():
+
+    def __init__(self, model_name:str, memory_size:int = 10000, disk_path:str = None, disk_size:int = 50000, flush_every:int = 100):
+        """
+            Two tier embedding cache: an in-memory LRU in front of a memory-mapped float16 vector file on disk.
+            The disk tier is a ring buffer, once full the oldest slot is overwritten. Every slot stores the digest of the key owning it
+            in a second memory-mapped file, so the key index is rebuilt from the slots on start and a slot is only served to its owner,
+            even if the process stopped before the last flush. A small json file keeps the size, dimension and next slot.
+
+            Args:
+                model_name (str): name of the embedding model, part of every key
+                memory_size (int, optional): maximum number of vectors in memory. Defaults to 10000.
+                disk_path (str, optional): directory of the disk tier. Defaults to None (memory tier only).
+                disk_size (int, optional): maximum number of vectors on disk. Defaults to 50000.
+                flush_every (int, optional): number of disk writes between flushes. Defaults to 100.
+        """
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.disk_path = disk_path
+        self.disk_size = disk_size
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        self.memory = OrderedDict()
+        self.dimension = None
+        self.vectors = None
+        self.slot_digests = None
+        self.disk_index = {}
+        self.next_slot = 0
+        self.pending_writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_path != None:
+            os.makedirs(self.disk_path, exist_ok=True)
+            self.vector_file = os.path.join(self.disk_path, f"{model_name}.f16")
+            self.digest_file = os.path.join(self.disk_path, f"{model_name}.keys")
+            self.index_file = os.path.join(self.disk_path, f"{model_name}.index.json")
+            self._load_disk()
+
+
+    def _load_disk(self):
+        """
+            Reopen the disk tier left by a previous process, if any
+        """
+        if not all(os.path.exists(file) for file in [self.index_file, self.vector_file, self.digest_file]):
+            return
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+            if index['disk_size'] != self.disk_size:
+                print("Embedding cache size changed, discarding disk tier")
+                return
+            self.dimension = index['dimension']
+            self.next_slot = index['next_slot']
+            self.vectors = np.memmap(self.vector_file, dtype=np.float16, mode='r+', shape=(self.disk_size, self.dimension))
+            self.slot_digests = np.memmap(self.digest_file, dtype=np.uint8, mode='r+', shape=(self.disk_size, 32))
+            digests = np.array(self.slot_digests)
+            raw = digests.tobytes()
+            for slot in np.flatnonzero(digests.any(axis=1)).tolist():
+                self.disk_index[raw[slot * 32:(slot + 1) * 32]] = slot
+        except Exception as e:
+            print(f"Unable to load embedding cache from disk due to {e}")
+            self.dimension = None
+            self.vectors = None
+            self.slot_digests = None
+            self.disk_index = {}
+            self.next_slot = 0
+
+
+    def _open_disk(self, dimension:int):
+        """
+            Create the vector and key digest files once the embedding dimension is known
+        """
+        self.dimension = dimension
+        self.vectors = np.memmap(self.vector_file, dtype=np.float16, mode='w+', shape=(self.disk_size, self.dimension))
+        self.slot_digests = np.memmap(self.digest_file, dtype=np.uint8, mode='w+', shape=(self.disk_size, 32))
+
+
+    def get(self, key:str):
+        """
+            Retrieve an embedding from memory, then disk
+
+            Args:
+                key (str): key from embeddingKey
+
+            Returns:
+                list of floats or None if not cached
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key].tolist()
+
+            digest = keyDigest(key)
+            slot = self.disk_index.get(digest)
+            if slot != None and self.slot_digests[slot].tobytes() == digest:
+                vector = self.vectors[slot].astype(np.float32)
+                self.disk_hits += 1
+                self._put_memory(key, vector)
+                return vector.tolist()
+
+            self.misses += 1
+            return None
+
+
+    def put(self, key:str, vector:list):
+        """
+            Store an embedding in both tiers
+
+            Args:
+                key (str): key from embeddingKey
+                vector (list): embedding
+        """
+        with self.lock:
+            self._put_memory(key, vector)
+            flush_due = self.disk_path != None and self._put_disk(key, vector)
+        if flush_due:
+            self.flush()
+
+
+    def _put_memory(self, key:str, vector):
+        self.memory[key] = np.asarray(vector, dtype=np.float32)
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+            self.memory_evictions += 1
+
+
+    def _put_disk(self, key:str, vector:list):
+        """
+            Write the vector into the next slot of the ring
+
+            Returns:
+                True when flush_every writes are waiting for a flush
+        """
+        digest = keyDigest(key)
+        if digest in self.disk_index:
+            return False
+        if self.vectors is None:
+            self._open_disk(len(vector))
+        if len(vector) != self.dimension:
+            return False
+
+        slot = self.next_slot
+        evicted_digest = self.slot_digests[slot].tobytes()
+        if self.disk_index.get(evicted_digest) == slot:
+            del self.disk_index[evicted_digest]
+            self.disk_evictions += 1
+
+        # the slot has no owner while its vector is replaced
+        self.slot_digests[slot] = 0
+        self.vectors[slot] = np.asarray(vector, dtype=np.float16)
+        self.slot_digests[slot] = np.frombuffer(digest, dtype=np.uint8)
+        self.disk_index[digest] = slot
+        self.next_slot = (slot + 1) % self.disk_size
+
+        self.pending_writes += 1
+        return self.pending_writes >= self.flush_every
+
+
+    def flush(self):
+        """
+            Persist the disk tier vectors, key digests and next slot.
+            Only the small metadata is read under the cache lock, lookups are not blocked while the files are synced
+        """
+        with self.flush_lock:
+            with self.lock:
+                if self.disk_path == None or self.vectors is None:
+                    return
+                index = {'disk_size': self.disk_size, 'dimension': self.dimension, 'next_slot': self.next_slot}
+                self.pending_writes = 0
+            self.vectors.flush()
+            self.slot_digests.flush()
+            temp_file = self.index_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_file, self.index_file)
+
+
+    def stats(self):
+        """
+            Cache metrics
+
+            Returns:
+                dictionary of hits, misses, hit rate, bytes used and eviction counts
+        """
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_entries": len(self.disk_index),
+                "memory_bytes": sum(vector.nbytes for vector in self.memory.values()),
+                "disk_bytes": len(self.disk_index) * ((self.dimension or 0) * 2 + 32),
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions
+            }
+
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+
+    def __init__(self, embedding_function, cache:EmbeddingCache):
+        """
+            Chroma embedding function that only sends texts missing from the cache to the wrapped embedding function
+
+            Args:
+                embedding_function (EmbeddingFunction): embedding function doing the actual network call
+                cache (EmbeddingCache): cache of the embeddings
+        """
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+
+    def __call__(self, texts):
+        keys = [embeddingKey(self.cache.model_name, text) for text in texts]
+        embeddings = [self.cache.get(key) for key in keys]
+
+        # identical texts in the same batch are only embedded once
+        missing = OrderedDict()
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                missing.setdefault(key, text)
+
+        if len(missing) > 0:
+            new_embeddings = self.embedding_function(list(missing.values()))
+            for key, embedding in zip(missing.keys(), new_embeddings):
+                self.cache.put(key, embedding)
+            lookup = dict(zip(missing.keys(), new_embeddings))
+            embeddings = [embedding if embedding is not None else lookup[key] for key, embedding in zip(keys, embeddings)]
+
+        return embeddings
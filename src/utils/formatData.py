@@ -1,4 +1,7 @@
 import re
+import json
+import difflib
+import hashlib
 from fastapi import HTTPException
 
 def formatTextMinutes(text_minutes:str, topic_id:str):
@@ -16,11 +19,32 @@ def formatTextMinutes(text_minutes:str, topic_id:str):
     list_of_sentences = text_minutes.split("\n")
     
     for index, sentence in enumerate(list_of_sentences):
-        minutes_dictionary[topic_id + str(index)] = sentence.strip()
+        minutes_dictionary[f"{topic_id}-{index}"] = sentence.strip()
 
     return minutes_dictionary
 
 
+def sentenceIndex(sentence_id:str, topic_id:str):
+    """
+        Index encoded in a sentenceID, "{topicID}-{index}".
+        Sentences written before the delimiter use "{topicID}{index}", which is only unambiguous once the topic is known
+
+        Args:
+            sentence_id (string): id of the sentence
+            topic_id (string): topic id the sentence belongs to
+
+        Return:
+            int index or None if the sentenceID does not encode an index of the topic
+    """
+    if sentence_id.startswith(f"{topic_id}-"):
+        suffix = sentence_id[len(topic_id) + 1:]
+    elif sentence_id.startswith(topic_id):
+        suffix = sentence_id[len(topic_id):]
+    else:
+        return None
+    return int(suffix) if suffix.isdigit() else None
+
+
 def formatMongoMinutes(mongo_minutes:list):
     """
         Format mongoDB minutes in the format of [{sentenceID:xx, sentenceText:yy}, ...]
@@ -38,6 +62,100 @@ def formatMongoMinutes(mongo_minutes:list):
     return minutes_dictionary
     
 
+def diffMinutes(existing_sentences:list, text_minutes:str, topic_id:str):
+    """
+        Line level diff (difflib) between the sentences stored in mongoDB and the new text minutes.
+        Unchanged lines keep their existing sentenceID even if they moved, edited lines keep the sentenceID of the line they replace,
+        and only inserted lines receive a new sentenceID, so an insertion is one new sentence instead of every following sentence changing
+
+        Args:
+            existing_sentences (list): sentences in mongoDB order, in the format of [{sentenceID:xx, sentenceText:yy}, ...]
+            text_minutes (string): each bullet point is seperated by \n
+            topic_id (string): topic id of the text_minutes
+
+        Return:
+            update_dict: dictionary in the format of {sentenceID: sentenceText or None if deleted} of the changed sentences
+            sentence_order: list of sentenceIDs in the order of the new minutes
+            moved_positions: dictionary in the format of {sentenceID: new index} for unchanged sentences whose index changed
+    """
+    old_ids = [sentence['sentenceID'] for sentence in existing_sentences]
+    old_lines = [sentence['sentenceText'] for sentence in existing_sentences]
+    new_lines = [sentence.strip() for sentence in text_minutes.split("\n")]
+
+    # new sentenceIDs continue after the largest existing index of the topic
+    next_index = 0
+    for sentence_id in old_ids:
+        index = sentenceIndex(sentence_id, topic_id)
+        if index != None:
+            next_index = max(next_index, index + 1)
+    next_index = max(next_index, len(old_ids))
+
+    update_dict = {}
+    sentence_order = []
+    moved_positions = {}
+
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(i2 - i1):
+                sentence_id = old_ids[i1 + offset]
+                if i1 != j1:
+                    moved_positions[sentence_id] = j1 + offset
+                sentence_order.append(sentence_id)
+            continue
+
+        # replace pairs old and new lines one to one, the rest are inserts or deletes
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        for offset in range(j2 - j1):
+            if offset < paired:
+                sentence_id = old_ids[i1 + offset]
+            else:
+                sentence_id = f"{topic_id}-{next_index}"
+                next_index += 1
+            update_dict[sentence_id] = new_lines[j1 + offset]
+            sentence_order.append(sentence_id)
+
+        for offset in range(paired, i2 - i1):
+            update_dict[old_ids[i1 + offset]] = None
+
+    return update_dict, sentence_order, moved_positions
+
+
+def contentHash(text:str):
+    """
+        Hash of a piece of text, used to check if stored results were computed from the same text
+
+        Args:
+            text (string): text to be hashed
+
+        Return:
+            hex digest string
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def trackerInputHash(text_minutes:str, topic_title:str, agenda:list, abbreviation:str, glossary:list = None):
+    """
+        Hash of everything TopicTracker, AgendaTracker and GlossaryDetector look at.
+        Stored verdicts are only reused when the hash matches, so a new agenda or glossary invalidates them automatically
+
+        Args:
+            text_minutes (string): minutes on the frontend
+            topic_title (string): topic title of the topic block
+            agenda (list): list of agenda items
+            abbreviation (string): abbreviation to be defined or None
+            glossary (list, optional): glossary GlossaryDetector resolves the abbreviation against, only hashed with an abbreviation. Defaults to None.
+
+        Return:
+            hex digest string
+    """
+    inputs = [text_minutes, topic_title, agenda, abbreviation]
+    if abbreviation != None:
+        inputs.append(glossary)
+    payload = json.dumps(inputs, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 # ########### New Stuff ############
 def formatTextMinutesList(text_minutes: str):
     """
@@ -87,15 +205,42 @@ def formatChatHistory(chat_history:list[dict]):
         Returns:
             formatted_chat_history: list of dictionary in the format [{role: user, content: query}, {role: assistant, content:response}, {}...]
     """
-    formatted_chat_history = []
-    chat_history = [chat for chat in chat_history if 'sourcetopicIDs' not in chat]
+    return list(iterChatHistory(chat_history))
 
-    while len(chat_history) > 0:
-        formatted_chat_history.append({'role': 'user', 'content': chat_history[0]['user']})
-        formatted_chat_history.append({'role': 'assistant', 'content': chat_history[0]['assistant']})
-        chat_history = chat_history[2:]
 
-    return formatted_chat_history
+def iterChatHistory(chat_history):
+    """
+        Generator version of formatChatHistory, a single pass over the turns
+
+        Args:
+            chat_history (iterable): turns in the format of {user: query, assistant: response}
+
+        Yields:
+            dictionary in the format {role: user / assistant, content: str}
+    """
+    for chat in chat_history:
+        if 'sourcetopicIDs' in chat:
+            continue
+        yield {'role': 'user', 'content': chat['user']}
+        yield {'role': 'assistant', 'content': chat['assistant']}
+
+def formatServerSentEvent(data:str, event:str = None):
+    """
+        Function to frame a piece of text as a server sent event.
+        Every line of the text gets its own data field so newlines inside the text survive the framing
+
+        Args:
+            data (str): text to be sent
+            event (str, optional): name of the event. Defaults to None (client receives it as a message).
+
+        Returns:
+            string in the format "event: xxx\ndata: line1\ndata: line2\n\n"
+    """
+    message = f"event: {event}\n" if event else ''
+    for line in data.split('\n'):
+        message += f"data: {line}\n"
+    return message + '\n'
+
 
 def formatPreSummaryMinutes(topics: list, topic_title: str) -> str:
     """
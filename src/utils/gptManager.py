@@ -1,12 +1,153 @@
-import time
 from fastapi import HTTPException
 import openai
 import os
+import aiohttp
 from starlette.responses import StreamingResponse
 import asyncio
+import time
 from utils.formatData import *
+from utils.responseCache import responseCacheKey, InMemoryResponseCache, SQLiteResponseCache
+from utils.chromaDBManager import embedSentences
+from utils.vectorTracker import topicCoherenceScore, agendaMatchScore
+from utils.acronymResolver import resolveAcronym
+
+# Single keep-alive aiohttp session shared by every openai acreate call
+gptSession = None
+# Opt-in GPT response cache, only used by callers listed in GPT_CACHE_CALLERS
+responseCache = None
+# Number of verdicts decided locally (embeddings, glossary, minutes) or by GPT per tracker
+trackerDecisions = {}
+
+
+async def openGPTSession(pool_size:int = None):
+    """
+        Function to create the aiohttp session shared by all GPT requests, called in the FastAPI lifespan
+
+        Args:
+            pool_size (int, optional): maximum number of pooled connections. Defaults to GPT_MAX_POOL_SIZE env variable or 100.
+
+        Returns:
+            aiohttp ClientSession
+    """
+    global gptSession
+    if pool_size == None:
+        pool_size = int(os.environ.get('GPT_MAX_POOL_SIZE') or 100)
+
+    if gptSession == None or gptSession.closed:
+        connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60)
+        gptSession = aiohttp.ClientSession(connector=connector)
+    return gptSession
+
+
+async def closeGPTSession():
+    """
+        Function to close the shared aiohttp session
+    """
+    global gptSession
+    if gptSession != None and not gptSession.closed:
+        await gptSession.close()
+    gptSession = None
+
+
+async def useGPTSession():
+    """
+        openai keeps its aiohttp session in a ContextVar, set it for the current task so acreate reuses the pooled session
+        instead of opening a new connection for every request
+    """
+    openai.aiosession.set(await openGPTSession())
+
+
+def getResponseCache():
+    """
+        Function to retrieve the GPT response cache, created on first use.
+        Backend is chosen by GPT_CACHE_BACKEND (memory / sqlite), entries expire after GPT_CACHE_TTL seconds and at most GPT_CACHE_SIZE are kept
+
+        Returns:
+            ResponseCache
+    """
+    global responseCache
+    if responseCache == None:
+        ttl = float(os.environ.get('GPT_CACHE_TTL') or 3600)
+        max_size = int(os.environ.get('GPT_CACHE_SIZE') or 1000)
+        if os.environ.get('GPT_CACHE_BACKEND') == 'sqlite':
+            responseCache = SQLiteResponseCache(os.environ.get('GPT_CACHE_PATH') or 'gpt_cache.sqlite3', ttl, max_size)
+        else:
+            responseCache = InMemoryResponseCache(ttl, max_size)
+    return responseCache
+
+
+def responseCacheEnabled(caller:str):
+    """
+        Function to check if a caller opted in to the response cache through GPT_CACHE_CALLERS (comma separated caller names, or * for all)
+
+        Args:
+            caller (str): name of the calling function
+
+        Returns:
+            True / False
+    """
+    if caller == None:
+        return False
+    enabled_callers = [name.strip() for name in (os.environ.get('GPT_CACHE_CALLERS') or '').split(',')]
+    return caller in enabled_callers or '*' in enabled_callers
+
+
+def responseCacheStats():
+    """
+        Function to retrieve the GPT response cache metrics
+
+        Returns:
+            dictionary of hit ratio and saved upstream latency, empty if the cache was never used
+    """
+    if responseCache == None:
+        return {}
+    return responseCache.stats()
+
+
+def countTrackerDecision(tracker:str, method:str):
+    """
+        Function to count how a tracker verdict was decided
+
+        Args:
+            tracker (str): name of the tracker
+            method (str): vector / glossary / minutes / llm
+    """
+    counts = trackerDecisions.setdefault(tracker, {})
+    counts[method] = counts.get(method, 0) + 1
+
+
+def trackerDecisionStats():
+    """
+        Function to retrieve the tracker decision metrics
+
+        Returns:
+            dictionary in the format {tracker: {method: int, llm_rate: float}}
+    """
+    stats = {}
+    for tracker, counts in trackerDecisions.items():
+        total = sum(counts.values())
+        stats[tracker] = {**counts, "llm_rate": round(counts.get("llm", 0) / total, 4) if total else 0.0}
+    return stats
+
 
-async def queryGPT(query:list, model:str='gpt-3.5-turbo', temperature:float=0.2, request_timeout:int=3, max_retries:int=3):
+async def embedAgenda(agenda:list):
+    """
+        Function to embed the agenda items, empty items are kept as None so indices match the agenda
+
+        Args:
+            agenda (list): list of agenda items
+
+        Returns:
+            list of embeddings or None
+    """
+    items = [item for item in agenda if item and item.strip()]
+    if len(items) == 0:
+        return [None] * len(agenda)
+    embeddings = iter(await embedSentences(items))
+    return [next(embeddings) if item and item.strip() else None for item in agenda]
+
+
+async def queryGPT(query:list, model:str='gpt-3.5-turbo', temperature:float=0.2, request_timeout:int=3, max_retries:int=3, caller:str=None):
     """
         General function to query gpt while maintaining timeout. Only returns full response
 
@@ -16,15 +157,25 @@ async def queryGPT(query:list, model:str='gpt-3.5-turbo', temperature:float=0.2,
             temperature (int): what temperature are you setting, defaults 0.2
             request_timeout (int): maximum time (in seconds) before timeout error
             max_retries (int): maximum number of retries in the case of timeout
+            caller (str): name of the calling function, responses are cached if the caller is enabled in GPT_CACHE_CALLERS
 
         Returns:
             gpt response
     """
+    cache_key = None
+    if responseCacheEnabled(caller):
+        cache_key = responseCacheKey(model, temperature, query)
+        cached_response = await getResponseCache().aget(cache_key, caller)
+        if cached_response != None:
+            return cached_response
+
     openai.api_key = os.environ['OPENAI_API_KEY']
+    await useGPTSession()
     retry_count = 0
     while retry_count <= max_retries:
         try:
-            response = openai.ChatCompletion.create(
+            start = time.perf_counter()
+            response = await openai.ChatCompletion.acreate(
                 model=model,
                 messages=query,
                 temperature=temperature,
@@ -37,7 +188,10 @@ async def queryGPT(query:list, model:str='gpt-3.5-turbo', temperature:float=0.2,
             #                             media_type='text/event-stream',
             #                             headers=header)
 
-            return response['choices'][0]['message']['content']
+            content = response['choices'][0]['message']['content']
+            if cache_key != None:
+                await getResponseCache().aset(cache_key, content, time.perf_counter() - start)
+            return content
         
         except Exception as e:
             print(e)
@@ -51,9 +205,9 @@ async def queryGPT(query:list, model:str='gpt-3.5-turbo', temperature:float=0.2,
 
 
 
-def streamGPTQuery(query:list, user_query:str, type:str, model:str='gpt-3.5-turbo', temperature:float=0.2, request_timeout:int=3, max_retries:int=3, source_ids = None, mongoDB = None):
+async def streamGPTQuery(query:list, user_query:str, type:str, model:str='gpt-3.5-turbo', temperature:float=0.2, request_timeout:int=3, max_retries:int=3, source_ids = None, mongoDB = None, coalesce_chars:int = None, coalesce_ms:int = None, background = None):
     """
-        Function to query gpt and return STREAMED response
+        Function to query gpt and return STREAMED response as server sent events
 
         Args:
             query (list): formatted user query with context to be passed to gpt
@@ -65,81 +219,158 @@ def streamGPTQuery(query:list, user_query:str, type:str, model:str='gpt-3.5-turb
             max_retries (int, optional): maximum number of retries before throwing an error. Defaults to 3.
             source_ids (list, optional): header to be added to the response. Defaults to None.
             mongoDB (mongoDB, optional): mongoDB instance to allow for updating of chatHistory. Defaults to None.
+            coalesce_chars (int, optional): flush buffered tokens once they reach this many characters. Defaults to STREAM_COALESCE_CHARS env variable or 0 (every token is sent on its own).
+            coalesce_ms (int, optional): flush buffered tokens once the oldest one has waited this long. Defaults to STREAM_COALESCE_MS env variable or 0.
+            background (BackgroundTask, optional): task run after the whole response was sent. Defaults to None.
 
         Returns:
             streamingResponse for fastAPI
     """
     openai.api_key = os.environ['OPENAI_API_KEY']
+    await useGPTSession()
     retry_count = 0
 
+    if coalesce_chars == None:
+        coalesce_chars = int(os.environ.get('STREAM_COALESCE_CHARS') or 0)
+    if coalesce_ms == None:
+        coalesce_ms = int(os.environ.get('STREAM_COALESCE_MS') or 0)
+
     header = {
-        "source_id": str(source_ids)
+        "source_id": str(source_ids),
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no" # stop reverse proxies from buffering the stream
     }
 
     while retry_count <= max_retries:
         try:
-            response = openai.ChatCompletion.create(
+            # aiohttp timeouts cover the whole stream, so only the connection is bounded by request_timeout
+            response = await openai.ChatCompletion.acreate(
                 model=model,
                 messages=query,
                 temperature=temperature,
-                request_timeout=request_timeout,
+                request_timeout=(request_timeout, None),
                 stream = True
             )
 
-            return StreamingResponse(streamGenerator(response, mongoDB, user_query, type, source_ids),
+            return StreamingResponse(streamGenerator(response, mongoDB, user_query, type, source_ids, coalesce_chars, coalesce_ms),
                                     media_type='text/event-stream',
-                                    headers=header)
+                                    headers=header,
+                                    background=background)
         
         except Exception as e:
             print(e)
             retry_count += 1
             if retry_count <= max_retries:
                 print(f"Request failed (Retry {retry_count}). Pausing for 1 second before retrying.")
-                time.sleep(1)
+                await asyncio.sleep(1)
             else:
                 print("Max retries reached. Returning an error.")
                 raise HTTPException(status_code=500, detail="GPT timeout, please check GPT server.")
 
 
-async def streamGenerator(response, mongoDB, user_query, type, source_ids):
+async def coalesceTokens(response, coalesce_chars:int, coalesce_ms:int):
+    """
+        Function to read tokens from the openai stream and group them into larger pieces.
+        A piece is released once it holds coalesce_chars characters or its first token has waited coalesce_ms, whichever comes first.
+        With both set to 0, every token is released as soon as it arrives.
+
+        Args:
+            response (async generator): streaming response from openai acreate
+            coalesce_chars (int): size window in characters
+            coalesce_ms (int): time window in milliseconds
+
+        Returns:
+            async generator of text pieces
+    """
+    loop = asyncio.get_running_loop()
+    buffer = ''
+    buffer_start = None
+    next_chunk = asyncio.ensure_future(response.__anext__())
+
+    try:
+        while True:
+            if buffer and coalesce_ms > 0:
+                # wait for the next token only as long as the time window allows
+                remaining = buffer_start + coalesce_ms / 1000 - loop.time()
+                done, _ = await asyncio.wait({next_chunk}, timeout=max(remaining, 0))
+                if not done:
+                    yield buffer
+                    buffer = ''
+                    continue
+
+            try:
+                chunk = await next_chunk
+            except StopAsyncIteration:
+                break
+            next_chunk = asyncio.ensure_future(response.__anext__())
+
+            if len(chunk['choices']) == 0:
+                continue
+            token = chunk['choices'][0]['delta'].get('content')
+            if not token:
+                continue
+
+            if not buffer:
+                buffer_start = loop.time()
+            buffer += token
+
+            no_coalescing = coalesce_chars <= 0 and coalesce_ms <= 0
+            if no_coalescing or (coalesce_chars > 0 and len(buffer) >= coalesce_chars):
+                yield buffer
+                buffer = ''
+
+        if buffer:
+            yield buffer
+
+    finally:
+        next_chunk.cancel()
+
+
+async def streamGenerator(response, mongoDB, user_query, type, source_ids, coalesce_chars:int = 0, coalesce_ms:int = 0):
     """
-        Function to prepare response for streaming
-        If the response ended (by having chunk['choices'][0]['delta'] == {}), update mongoDB
+        Function to prepare response for streaming as server sent events
+        Once the openai stream is exhausted, update mongoDB and send the [DONE] event
     
         Args:
-            response (streaming_chunk): chunk of streaming response
+            response (async generator): streaming response from openai acreate
             mongoDB: instance of mongoDB for updating chatHistory
             user_query: original user query
             type: document / web for mongoDB to update
             source_ids: update topic ids
+            coalesce_chars (int): size window in characters for grouping tokens, 0 to disable
+            coalesce_ms (int): time window in milliseconds for grouping tokens, 0 to disable
     """
     full_response = ''
     try:
-        for chunk in response:
-            if chunk['choices'][0]['delta'] != {}:
-                yield chunk['choices'][0]['delta']['content']
-                full_response += chunk['choices'][0]['delta']['content']
-                await asyncio.sleep(0.1)
+        async for text in coalesceTokens(response, coalesce_chars, coalesce_ms):
+            full_response += text
+            yield formatServerSentEvent(text)
+
+        if mongoDB:
+            if source_ids != None:
+                query_resp_pair = {'user': user_query, 'assistant': full_response, 'sourcetopicIDs': source_ids}
             else:
-                if mongoDB:
-                    if source_ids != None:
-                        query_resp_pair = {'user': user_query, 'assistant': full_response, 'sourcetopicIDs': source_ids}
-                    else:
-                        query_resp_pair = {'user': user_query, 'assistant': full_response}
+                query_resp_pair = {'user': user_query, 'assistant': full_response}
+
+            await mongoDB.update_chat_history(query_resp_pair, type)
+
+        yield formatServerSentEvent('[DONE]')
 
-                    await mongoDB.update_chat_history(query_resp_pair, type)
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Stream timed out")
     
 
 
-async def TopicTracker(current_minutes: str, topic_title: str):
+async def TopicTracker(current_minutes: str, topic_title: str, new_sentences: list = None):
     """
         Return True or False on whether the current sentence is still coherent with the topic block.
+        With TOPIC_TRACKER_MODE=vector, the newest sentences are scored against the topic centroid with embeddings
+        and GPT is only asked when the score falls between TOPIC_TRACKER_LOWER and TOPIC_TRACKER_UPPER
         
         Args:
             current_minutes: existing minutes on the frontend
             topic_title: title of the topic block
+            new_sentences: sentences added or edited in this update, defaults to the last sentence
         Return:
             True or False 
             if Chatgpt returns something other than T/F, then we will print a statement and take as True
@@ -149,6 +380,20 @@ async def TopicTracker(current_minutes: str, topic_title: str):
     if len(sentence_list) <= 3:
         return True #return true is only 1 sentence 
 
+    if (os.environ.get('TOPIC_TRACKER_MODE') or 'llm') == 'vector':
+        lower = float(os.environ.get('TOPIC_TRACKER_LOWER') or 0.75)
+        upper = float(os.environ.get('TOPIC_TRACKER_UPPER') or 0.82)
+        newest = set(formatTextMinutesList("\n".join(new_sentences))) if new_sentences else set()
+        newest_indices = [i for i, sentence in enumerate(sentence_list) if sentence in newest] or [len(sentence_list) - 1]
+
+        score = topicCoherenceScore(await embedSentences(sentence_list), newest_indices)
+        if score >= upper or score < lower:
+            countTrackerDecision("TopicTracker", "vector")
+            return score >= upper
+        print(f"TopicTracker score {score:.3f} is uncertain, asking GPT")
+
+    countTrackerDecision("TopicTracker", "llm")
+
     # check if there is a unique topic title 
     default_topic_title = topicTitle_match(topic_title)
     minutes_context = ""
@@ -170,7 +415,7 @@ async def TopicTracker(current_minutes: str, topic_title: str):
     =========================================
     """}]
 
-    response = await queryGPT(query_message, temperature=0.1, request_timeout=5)
+    response = await queryGPT(query_message, temperature=0.1, request_timeout=5, caller="TopicTracker")
 
     if response == "True":
         return True
@@ -182,22 +427,39 @@ async def TopicTracker(current_minutes: str, topic_title: str):
 
 
 
-async def AgendaTracker(current_minutes: str, topic_title:str, agenda: list):
+async def AgendaTracker(current_minutes: str, topic_title:str, agenda: list, agenda_embeddings: list = None):
     """
         Return True or False on whether the current sentence is still coherent with the agenda of the meeting.
+        With AGENDA_TRACKER_MODE=vector, the minutes are scored against the agenda embedding matrix
+        and GPT is only asked when the score falls between AGENDA_TRACKER_LOWER and AGENDA_TRACKER_UPPER
 
         Args:
             current_minutes: existing minutes on the frontend
             topic_title: title of the topic block
             agenda: the list of agenda items
+            agenda_embeddings: embeddings of the agenda items stored by update_agenda_meeting, embedded here if missing
         Return:
-            True or False 
+            tuple of (True or False, index of the best matching agenda item or None)
             if Chatgpt returns something other than T/F, then we will print a statement and take as True
     """
     # check how many sentences in meeting minutes
     sentence_list = formatTextMinutesList(current_minutes)
     if len(sentence_list) <= 1:
-        return True #return true is only 1 sentence 
+        return True, None #return true is only 1 sentence 
+
+    if (os.environ.get('AGENDA_TRACKER_MODE') or 'llm') == 'vector' and any(agenda):
+        lower = float(os.environ.get('AGENDA_TRACKER_LOWER') or 0.72)
+        upper = float(os.environ.get('AGENDA_TRACKER_UPPER') or 0.80)
+        if agenda_embeddings == None or len(agenda_embeddings) != len(agenda):
+            agenda_embeddings = await embedAgenda(agenda)
+
+        score, agenda_index = agendaMatchScore(await embedSentences(sentence_list), agenda_embeddings)
+        if score >= upper or score < lower:
+            countTrackerDecision("AgendaTracker", "vector")
+            return score >= upper, agenda_index
+        print(f"AgendaTracker score {score:.3f} is uncertain, asking GPT")
+
+    countTrackerDecision("AgendaTracker", "llm")
     
     # create agenda context
     agenda_context = ""
@@ -230,32 +492,42 @@ async def AgendaTracker(current_minutes: str, topic_title:str, agenda: list):
     """}
     ]
 
-    response = await queryGPT(query_message, temperature=0.1, request_timeout=5)
+    response = await queryGPT(query_message, temperature=0.1, request_timeout=5, caller="AgendaTracker")
     
     if response == "True":
-        return True
+        return True, None
     elif response == "False":
-        return False
+        return False, None
     else:
         print("errornous GPT response, taking as True and skipping")
-        return True
+        return True, None
 
 
 
-async def GlossaryDetector(current_minutes: str, topic_title:str, abbreviation:str):
+async def GlossaryDetector(current_minutes: str, topic_title:str, abbreviation:str, glossary: list = None):
     """
         Return what the abbreviation stands for in the context of the sentences provided
+        The glossary of the meeting and any expansion written in the minutes are checked first, GPT is only asked when neither matches
 
         Args:
             current_minutes: existing minutes on the frontend
             topic_title: title of the topic block
             abbreviation: the abbreviation to be defined
+            glossary: glossary array of the minutes document
         Return:
             number of words equivilant to the number of letters in the Abbreviation provided
     """
     if abbreviation == None:
         return None
     else:
+        meaning, source = resolveAcronym(abbreviation, current_minutes, glossary, float(os.environ.get('GLOSSARY_MIN_SCORE') or 0.85))
+        if meaning != None:
+            countTrackerDecision("GlossaryDetector", source)
+            if meaning.startswith(f"{abbreviation}:"):
+                return meaning
+            return f"{abbreviation}: {meaning}"
+        countTrackerDecision("GlossaryDetector", "llm")
+
         # check if there is a unique topic title 
         default_topic_title = topicTitle_match(topic_title)
         minutes_context = ""
@@ -277,11 +549,15 @@ async def GlossaryDetector(current_minutes: str, topic_title:str, abbreviation:s
         =========================================
         """}]
 
-        response = await queryGPT(query_message, request_timeout=5)
+        response = await queryGPT(query_message, request_timeout=5, caller="GlossaryDetector")
         return response.strip().rstrip('.')
     
 
 
+# Number of user queries and responses createStandAloneQuery uses as context
+STANDALONE_QUERY_TURNS = 3
+
+
 async def createStandAloneQuery(formatted_chat_history:list, query:str):
     """
         Function to convert the latest user query to a standalone question such that it can be used to query to the chromaDB
@@ -295,17 +571,12 @@ async def createStandAloneQuery(formatted_chat_history:list, query:str):
             formatted query to become a standalone question
     """
     #only taking latest 3 user query
-    if len(formatted_chat_history) > 6:
-        formatted_chat_history = formatted_chat_history[len(formatted_chat_history)-6:]
+    if len(formatted_chat_history) > 2 * STANDALONE_QUERY_TURNS:
+        formatted_chat_history = formatted_chat_history[len(formatted_chat_history)-2 * STANDALONE_QUERY_TURNS:]
         print(formatted_chat_history)
     
     #creating chat context
-    chat_context = ''
-    while len(formatted_chat_history) > 0:
-        chat_context += f'{formatted_chat_history[0]["role"]}: {formatted_chat_history[0]["content"]}\n'
-        chat_context += f'{formatted_chat_history[1]["role"]}: {formatted_chat_history[1]["content"]}\n'
-        formatted_chat_history = formatted_chat_history[2:]
-        print(len(formatted_chat_history))
+    chat_context = ''.join(f'{message["role"]}: {message["content"]}\n' for message in formatted_chat_history)
     
     
     system_prompt = f"""You are given a conversation. Given a new question, you task is to rephrase the last user query to be a standalone question in its own original language. If the last user query is unrelated to the conversation, return the query. Your response should just be the question and nothing else.
@@ -316,7 +587,36 @@ async def createStandAloneQuery(formatted_chat_history:list, query:str):
     Last user query: {query}
     """
     query_message = [{"role": "system", "content": system_prompt}]
-    response =  await queryGPT(query_message)
+    response =  await queryGPT(query_message, caller="createStandAloneQuery")
+    return response.strip()
+
+
+
+async def summariseConversation(summary:str, formatted_chat_history:list):
+    """
+        Function to fold older turns of a conversation into its rolling summary
+
+        Args:
+            summary (string): current summary, None if there is none yet
+            formatted_chat_history (list): turns to be folded in, in the format [{role: user, content: query}, {role: assistant, content: response}]
+
+        Returns:
+            new summary
+    """
+    chat_context = ''.join(f'{message["role"]}: {message["content"]}\n' for message in formatted_chat_history)
+    query_message = [{"role": "system", "content": 
+    f"""You are given the summary of a conversation and the turns that followed it.
+    Rewrite the summary so it also covers the new turns. Keep facts, names and numbers the user may ask about again.
+    Your response should just be the summary, less than 150 words.
+    =========================================
+    Summary:
+    {summary or 'None'}
+    -----------------------------------------
+    New turns:
+    {chat_context}
+    =========================================
+    """}]
+    response = await queryGPT(query_message, request_timeout=10, caller="summariseConversation")
     return response.strip()
 
 
@@ -349,13 +649,14 @@ async def documentQuery(query:str, context_dict:dict):
 
 
 
-async def webQuery(query:str, context:list):
+async def webQuery(query:str, context:list, summary:str = None):
     """
         Function to query GPT based on the conversation you had with it
 
         Args:
             query (string): reformatted user query
             context (list): 
+            summary (string, optional): summary of the turns older than the context. Defaults to None.
 
         Returns:
             formatted query message
@@ -363,6 +664,8 @@ async def webQuery(query:str, context:list):
     query_message = [
             {"role": "system", "content": "You are an Simple question and answer Model. You do not have individuality, opinion or a personality. You will receive a question. Answer the question in the most straight forward way possible. Minimising words where possible. Try and keep responses below 50 words."},
         ]
+    if summary:
+        query_message.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
     query_message = query_message + context
     print(query_message)
     query_message.append({"role": "user", "content": query})
@@ -1,21 +1,86 @@
-import pymongo
 import os
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 from fastapi import HTTPException
 from datetime import datetime
 from bson import ObjectId
 
 
+def createMongoClient(max_pool_size:int = None):
+    """
+        Function to create the MongoClient shared by the whole application.
+        The motor client is async-native so database round trips yield to the event loop instead of blocking it.
+        It keeps its own connection pool, so it should be created once (in the FastAPI lifespan) and passed to every MongoDBManager
+
+        Args:
+            max_pool_size (int, optional): maximum number of pooled connections. Defaults to MONGODB_MAX_POOL_SIZE env variable or 100.
+
+        Returns:
+            motor AsyncIOMotorClient
+    """
+    if max_pool_size == None:
+        max_pool_size = int(os.environ.get('MONGODB_MAX_POOL_SIZE') or 100)
+
+    mongoDB_url = f"mongodb://{os.environ['MONGODB_USERNAME']}:{os.environ['MONGODB_PASSWORD']}@{os.environ['MONGODB_URL']}"
+    return AsyncIOMotorClient(mongoDB_url, maxPoolSize=max_pool_size)
+
+
+
+async def createIndexes(client):
+    """
+        Function to create the indexes the application relies on, called in the FastAPI lifespan
+
+        Args:
+            client (AsyncIOMotorClient): application MongoClient created with createMongoClient
+    """
+    await client['document_db'].chatHistoryArchive.create_index([("chatHistoryID", ASCENDING), ("type", ASCENDING), ("seq", ASCENDING)], unique=True)
+
+
+
+def chatHistoryWindow(total:int, before:int = None, after:int = None, limit:int = None):
+    """
+        Sequence number range of a chat history page. Turns are numbered from 0 in the order they were appended
+
+        Args:
+            total (int): number of turns in the chat history
+            before (int, optional): only turns older than this sequence number, the newest limit of them
+            after (int, optional): only turns newer than this sequence number, the oldest limit of them
+            limit (int, optional): maximum number of turns. Defaults to None (no limit).
+
+        Returns:
+            tuple of (first sequence number, end sequence number), end excluded
+    """
+    hi = total if before == None else max(0, min(before, total))
+    lo = 0 if after == None else max(0, min(after + 1, total))
+    if limit != None:
+        if after != None:
+            hi = min(hi, lo + limit)
+        else:
+            lo = max(lo, hi - limit)
+    return lo, max(lo, hi)
+
+
+
 class MongoDBManager():
-    def __init__(self, minutesID, chatHistoryID):
-        self.mongoDB_url = f"mongodb://{os.environ['MONGODB_USERNAME']}:{os.environ['MONGODB_PASSWORD']}@{os.environ['MONGODB_URL']}"
-        self.client = pymongo.MongoClient(self.mongoDB_url)
+    def __init__(self, minutesID, chatHistoryID, client):
+        """
+            Lightweight per request view over the shared MongoClient, does not open any connection by itself
+
+            Args:
+                minutesID (str): minutes document id
+                chatHistoryID (str): chatHistory document id
+                client (AsyncIOMotorClient): application MongoClient created with createMongoClient
+        """
+        self.client = client
         self.database = self.client['document_db']
         self.minutesID = ObjectId(minutesID)
         self.chatHistoryID = ObjectId(chatHistoryID)
 
 
 
-    def read_MongoDB(self, collection_name:str, agenda:bool= False, topic_id:str= None, chat_history_type:str= None):
+    async def read_MongoDB(self, collection_name:str, agenda:bool= False, topic_id:str= None, chat_history_type:str= None, last_n:int= None):
         """
             Function to read from MongoDB
 
@@ -24,6 +89,7 @@ class MongoDBManager():
                 agenda (boolean): True to query agenda, else use False
                 topic_id (str): Used to query the topic through topicID
                 chat_history_type (str): Used to determine which chatHistory to query, Only document / web
+                last_n (int): Only return the last n turns of the chatHistory, sliced by the server. Defaults to None (all turns)
             
             Res: 
                 mongoDB response, always in the format of a JSON
@@ -34,12 +100,12 @@ class MongoDBManager():
 
         elif collection_name == "minutes":
             if agenda:
-                agendaData = self.database.minutes.find_one({'_id': self.minutesID}, {"agenda": 1, "_id": 0})
+                agendaData = await self.database.minutes.find_one({'_id': self.minutesID}, {"agenda": 1, "agendaEmbeddings": 1, "_id": 0})
                 return agendaData
 
             else:
                 query = {"topics.topicID": topic_id, '_id': self.minutesID}
-                topicData = self.database.minutes.find_one(query,  {"topics.$": 1}) #topics.$ means include the result that FIRST matches the condition
+                topicData = await self.database.minutes.find_one(query,  {"topics.$": 1}) #topics.$ means include the result that FIRST matches the condition
                 # if topicId does not exist
                 if topicData:
                     return topicData['topics'][0]
@@ -47,25 +113,61 @@ class MongoDBManager():
                     return None
 
         else:
-            chatHistory = self.database.chatHistory.find_one({'_id': self.chatHistoryID}, {f"{chat_history_type}": 1, "_id": 0})
+            if last_n != None:
+                # expression projection, only the last n turns leave the server (every turn if there are fewer than n),
+                # $ifNull keeps a missing array an empty list instead of null
+                history = {"$ifNull": [f"${chat_history_type}", []]}
+                projection = {f"{chat_history_type}": {"$slice": [history, -last_n]}, f"{chat_history_type}Seq": 1, "_id": 0}
+            else:
+                projection = {f"{chat_history_type}": 1, f"{chat_history_type}Seq": 1, "_id": 0}
+            chatHistory = await self.database.chatHistory.find_one({'_id': self.chatHistoryID}, projection)
             if chatHistory:
+                turns = chatHistory.get(chat_history_type, [])
+                # capped chat history, the rest of the window is in the archive
+                if last_n != None and len(turns) < last_n and chatHistory.get(f"{chat_history_type}Seq", 0) > len(turns):
+                    first_seq = chatHistory[f"{chat_history_type}Seq"] - len(turns)
+                    chatHistory[chat_history_type] = await self.read_chat_archive(chat_history_type, last_n - len(turns), first_seq) + turns
                 return chatHistory
             else:
                 raise HTTPException(status_code=422,detail="ChatHistory Document unfound in Database")
 
     
-    def read_glossary(self):
-        glossaryData = self.database.minutes.find_one({'_id': self.minutesID}, {"glossary": 1, "_id": 0})
+    async def read_topics(self, topic_ids:list = None):
+        """
+            Function to read the title and sentences of every topic in one query
+
+            Args:
+                topic_ids (list, optional): only return these topics, in this order. Defaults to None (all topics).
+
+            Returns:
+                list of topics in the format [{topicID: str, topicTitle: str, sentences: list, summary: str, summaryHash: str}]
+        """
+        minutesData = await self.database.minutes.find_one({'_id': self.minutesID},
+                                                           {"topics.topicID": 1, "topics.topicTitle": 1, "topics.sentences": 1,
+                                                            "topics.summary": 1, "topics.summaryHash": 1, "_id": 0})
+        if minutesData == None:
+            raise HTTPException(status_code=422,detail="Minutes Document unfound in Database")
+
+        topics = minutesData.get('topics', [])
+        if topic_ids == None:
+            return topics
+        topic_lookup = {topic['topicID']: topic for topic in topics}
+        return [topic_lookup[topic_id] for topic_id in topic_ids if topic_id in topic_lookup]
+
+
+    async def read_glossary(self):
+        glossaryData = await self.database.minutes.find_one({'_id': self.minutesID}, {"glossary": 1, "_id": 0})
         return glossaryData
 
 
-    async def update_agenda_meeting(self, new_data, agenda:bool):
+    async def update_agenda_meeting(self, new_data, agenda:bool, agenda_embeddings:list = None):
         """
             Function to replace data in MongoDB
 
             Args: 
                 new_data (list / dictionary): if agenda, expect list, if not agenda (meetingDetails), expect JSON
                 agenda (boolean): True to replace agenda, else use False
+                agenda_embeddings (list, optional): embeddings of the agenda items stored with the agenda. Defaults to None (stored embeddings are removed).
             
             Res: 
                 dictionary of status
@@ -73,6 +175,11 @@ class MongoDBManager():
         if agenda and isinstance(new_data, list):
             # new_data in the format of [agenda, agenda etc]
             update_query = {"$set": {"agenda": new_data}}
+            if agenda_embeddings != None:
+                update_query["$set"]["agendaEmbeddings"] = agenda_embeddings
+            else:
+                # embeddings of the previous agenda must not be matched against the new one
+                update_query["$unset"] = {"agendaEmbeddings": ""}
 
         elif not agenda and isinstance(new_data, dict):
             # new_data in the format of {date:xxx, location:xxx, attendees: []}
@@ -87,7 +194,7 @@ class MongoDBManager():
             raise HTTPException(status_code=422,detail="Invalid minutes input for updating")
 
         filter_query = {"_id": self.minutesID}      
-        update = self.database.minutes.update_one(filter_query, update_query)
+        update = await self.database.minutes.update_one(filter_query, update_query)
         if update.modified_count > 0 and update.acknowledged:
             return {'status': 200}
         elif update.acknowledged:
@@ -97,7 +204,7 @@ class MongoDBManager():
 
 
 
-    async def update_topic_minutes(self, update_list: dict, create_topic: bool, topic_id: str, topic_title: str):
+    async def update_topic_minutes(self, update_list: dict, create_topic: bool, topic_id: str, topic_title: str, sentence_order: list = None):
         """
         Function to update minutes in MongoDB
 
@@ -106,6 +213,7 @@ class MongoDBManager():
             create_topic (boolean): True/False to determine if you need to create a topic in the database
             topic_id (string): string containing the topic id
             topic_title (string): string containing the topic title
+            sentence_order (list, optional): sentenceIDs in their new order, sentences are reordered to match when given. Defaults to None.
 
         Returns:
             dictionary of status
@@ -125,80 +233,165 @@ class MongoDBManager():
                 new_topic['sentences'].append(sentence_dict)
 
             update_operation = {"$push": {"topics": new_topic}}
-            update = self.database.minutes.update_one(filter_query, update_operation)
+            update = await self.database.minutes.update_one(filter_query, update_operation)
             if not update.acknowledged:
                 raise HTTPException(status_code=422,detail="Create topic in Database Failed")
 
         else:
-            #Update topic title 
-            update_operation = {
-                "$set": {
-                    "topics.$[topic].topicTitle": topic_title
-                },
-            }
-            array_filters = [
-                        {"topic.topicID": topic_id},
-                    ]
-            
-            update = self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
-
-
+            # Title and every changed sentence are applied in ONE pipeline update, atomic on the minutes document
+            update = await self.database.minutes.update_one(filter_query, self._topic_update_pipeline(update_list, topic_id, topic_title, sentence_order))
             if not update.acknowledged:
                 raise HTTPException(status_code=422,detail="Updating Database Failed")
 
-            for sentence_id in update_list.keys():
-                if update_list[sentence_id] == None:
-                    #Delete sentence from database
-                    update_operation = {
-                        "$pull": {
-                            "topics.$[topic].sentences": {"sentenceID": sentence_id}
-                        },
-                    }
-                    
-                    array_filters = [
-                        {"topic.topicID": topic_id},
+        return {"status": 200}
+
+
+    def _topic_update_pipeline(self, update_list: dict, topic_id: str, topic_title: str, sentence_order: list = None):
+        """
+        Build the aggregation pipeline update that rewrites one topic's title and sentences.
+        Same semantics as individual updates: existing sentenceIDs are replaced in place, new ones are appended in order
+        and sentenceIDs mapped to None are removed. If sentence_order is given, the sentences are then reordered to follow it
+
+        Args:
+            update_list (dictionary): dictionary in the form of {sentenceID: sentenceText or None, ...}
+            topic_id (string): string containing the topic id
+            topic_title (string): string containing the topic title
+            sentence_order (list, optional): sentenceIDs in their new order. Defaults to None.
+
+        Returns:
+            list containing the pipeline stage
+        """
+        deleted_ids = [sentence_id for sentence_id, text in update_list.items() if text == None]
+        changed = [{"sentenceID": sentence_id, "sentenceText": text} for sentence_id, text in update_list.items() if text != None]
+        changed_ids = [sentence["sentenceID"] for sentence in changed]
+
+        # every value from the caller is wrapped in $literal, so a topicID, sentenceID or sentence starting with $
+        # is compared as a string instead of being read as a field path or operator
+        changed = {"$literal": changed}
+        deleted_ids = {"$literal": deleted_ids}
+        changed_ids = {"$literal": changed_ids}
+        existing_sentences = {"$ifNull": ["$$topic.sentences", []]}
+
+        kept_sentences = {
+            "$map": {
+                "input": {"$filter": {"input": existing_sentences, "as": "sentence", "cond": {"$not": [{"$in": ["$$sentence.sentenceID", deleted_ids]}]}}},
+                "as": "sentence",
+                "in": {
+                    "$cond": [
+                        {"$in": ["$$sentence.sentenceID", changed_ids]},
+                        {"$arrayElemAt": [changed, {"$indexOfArray": [changed_ids, "$$sentence.sentenceID"]}]},
+                        "$$sentence"
                     ]
+                }
+            }
+        }
+        new_sentences = {
+            "$filter": {"input": changed, "as": "sentence", "cond": {"$not": [{"$in": ["$$sentence.sentenceID", {"$map": {"input": existing_sentences, "as": "s", "in": "$$s.sentenceID"}}]}]}}
+        }
 
-                elif self.database.minutes.count_documents({
-                    **filter_query,
-                    "topics": {
-                        "$elemMatch": {
-                            "topicID": topic_id,
-                            "sentences": {
-                                "$elemMatch": {
-                                    "sentenceID": sentence_id
+        sentences = {"$concatArrays": [kept_sentences, new_sentences]}
+        if sentence_order != None:
+            sentences = {
+                "$let": {
+                    "vars": {"merged": sentences},
+                    "in": {
+                        "$filter": {
+                            "input": {
+                                "$map": {
+                                    "input": {"$literal": sentence_order},
+                                    "as": "id",
+                                    "in": {
+                                        "$cond": [
+                                            {"$in": ["$$id", "$$merged.sentenceID"]},
+                                            {"$arrayElemAt": ["$$merged", {"$indexOfArray": ["$$merged.sentenceID", "$$id"]}]},
+                                            None
+                                        ]
+                                    }
                                 }
-                            }
+                            },
+                            "as": "sentence",
+                            "cond": {"$ne": ["$$sentence", None]}
                         }
                     }
-                }) > 0:
-                    #Sentence exist, replace with new sentence
-                    update_operation = {
-                        "$set": {
-                            "topics.$[topic].sentences.$[sentence].sentenceText": update_list[sentence_id]
-                        },
-                    }
-
-                    array_filters = [
-                        {"topic.topicID": topic_id},
-                        {"sentence.sentenceID": sentence_id}
-                    ]
+                }
+            }
 
-                else:
-                    #push to the sentences db
-                    update_operation = {
-                        "$push": {
-                            "topics.$[topic].sentences": {"sentenceID": sentence_id, "sentenceText": update_list[sentence_id]}
+        return [{
+            "$set": {
+                "topics": {
+                    "$map": {
+                        "input": "$topics",
+                        "as": "topic",
+                        "in": {
+                            "$cond": [
+                                {"$eq": ["$$topic.topicID", {"$literal": topic_id}]},
+                                # the stored summary no longer matches the sentences
+                                {"$mergeObjects": ["$$topic", {"topicTitle": {"$literal": topic_title}, "sentences": sentences, "summary": None, "summaryHash": None}]},
+                                "$$topic"
+                            ]
                         }
                     }
-                    array_filters = [
-                        {"topic.topicID": topic_id},
-                    ]
+                }
+            }
+        }]
+
+
+    async def update_topic_summary(self, topic_id: str, summary: str, summary_hash: str):
+        """
+        Function to store the summary of a topic with the hash of the formatted minutes it was written from
+
+        Args:
+            topic_id (string): string containing the topic id
+            summary (string): synopsis of the topic
+            summary_hash (string): contentHash of the formatPreSummaryMinutes output
+
+        Returns:
+            dictionary of status
+        """
+        filter_query = {"_id": self.minutesID}
+        update_operation = {
+            "$set": {
+                "topics.$[topic].summary": summary,
+                "topics.$[topic].summaryHash": summary_hash
+            }
+        }
+        array_filters = [
+            {"topic.topicID": topic_id},
+        ]
 
-                update = self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
+        update = await self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
+        if not update.acknowledged:
+            raise HTTPException(status_code=422,detail="Updating Database Failed")
+
+        return {"status": 200}
+
+
+    async def update_topic_verdicts(self, topic_id: str, verdicts: dict, input_hash: str):
+        """
+        Function to store the last tracker verdicts of a topic with the hash of the input they were computed from
+
+        Args:
+            topic_id (string): string containing the topic id
+            verdicts (dictionary): dictionary in the format {topic: True/False, agenda: True/False, abbreviation: None or meaning}
+            input_hash (string): trackerInputHash of the minutes, topic title, agenda and abbreviation
+
+        Returns:
+            dictionary of status
+        """
+        filter_query = {"_id": self.minutesID}
+        update_operation = {
+            "$set": {
+                "topics.$[topic].verdicts": verdicts,
+                "topics.$[topic].verdictHash": input_hash
+            }
+        }
+        array_filters = [
+            {"topic.topicID": topic_id},
+        ]
 
-                if not update.acknowledged:
-                    raise HTTPException(status_code=422,detail="Updating Database Failed")
+        update = await self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
+        if not update.acknowledged:
+            raise HTTPException(status_code=422,detail="Updating Database Failed")
 
         return {"status": 200}
 
@@ -239,7 +432,7 @@ class MongoDBManager():
                 {"abbrev.abbreviation": abbreviation},
             ]
         
-        update = self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
+        update = await self.database.minutes.update_one(filter_query, update_operation, array_filters=array_filters)
         if not update.acknowledged:
             raise HTTPException(status_code=422,detail="Unable to delete topic")
 
@@ -265,7 +458,7 @@ class MongoDBManager():
             }
         }
 
-        update = self.database.minutes.update_one(filter_query, update_operation)
+        update = await self.database.minutes.update_one(filter_query, update_operation)
         if not update.acknowledged:
             raise HTTPException(status_code=422,detail="Unable to delete topic")
 
@@ -273,9 +466,180 @@ class MongoDBManager():
 
     
 
+    async def read_chat_archive(self, query_type:str, last_n:int = None, before:int = None):
+        """
+            Function to read the turns moved out of the capped chat history, oldest first
+
+            Args:
+                query_type (string): only web/document
+                last_n (int, optional): only return the newest n archived turns. Defaults to None (all archived turns).
+                before (int, optional): only return turns with a lower sequence number, the first sequence number still in the chatHistory
+                                        document, as turns are archived before they are trimmed from it. Defaults to None (no bound).
+
+            Returns:
+                list of turns in the format [{'user': query, 'assistant': gpt response}]
+        """
+        query = {"chatHistoryID": self.chatHistoryID, "type": query_type}
+        if before != None:
+            query["seq"] = {"$lt": before}
+        if last_n != None:
+            archived = await self.database.chatHistoryArchive.find(query, {"turn": 1, "_id": 0}).sort("seq", DESCENDING).limit(last_n).to_list(None)
+            archived.reverse()
+        else:
+            archived = await self.database.chatHistoryArchive.find(query, {"turn": 1, "_id": 0}).sort("seq", ASCENDING).to_list(None)
+        return [document['turn'] for document in archived]
+
+
+    async def read_chat_archive_range(self, query_type:str, start:int, end:int):
+        """
+            Function to read archived turns by sequence number, oldest first
+
+            Args:
+                query_type (string): only web/document
+                start (int): first sequence number
+                end (int): end sequence number, excluded
+
+            Returns:
+                list of turns
+        """
+        query = {"chatHistoryID": self.chatHistoryID, "type": query_type, "seq": {"$gte": start, "$lt": end}}
+        archived = await self.database.chatHistoryArchive.find(query, {"turn": 1, "_id": 0}).sort("seq", ASCENDING).to_list(None)
+        return [document['turn'] for document in archived]
+
+
+    def _chat_history_window_projection(self, query_type:str, before:int, after:int, limit:int):
+        """
+            Projection expression of chatHistoryWindow, slices the turns of the page out of the chatHistory document on the server
+        """
+        turns = {"$ifNull": [f"${query_type}", []]}
+        lo = 0 if after == None else {"$max": [0, {"$min": [after + 1, "$$total"]}]}
+        hi = "$$total" if before == None else {"$max": [0, {"$min": [before, "$$total"]}]}
+        if limit != None and after != None:
+            window = {"lo": "$$lo0", "hi": {"$min": ["$$hi0", {"$add": ["$$lo0", limit]}]}}
+        elif limit != None:
+            window = {"lo": {"$max": ["$$lo0", {"$subtract": ["$$hi0", limit]}]}, "hi": "$$hi0"}
+        else:
+            window = {"lo": "$$lo0", "hi": "$$hi0"}
+
+        return {"$let": {
+            "vars": {"turns": turns, "size": {"$size": turns}, "total": {"$ifNull": [f"${query_type}Seq", {"$size": turns}]}},
+            "in": {"$let": {
+                "vars": {"first": {"$subtract": ["$$total", "$$size"]}, "lo0": lo, "hi0": hi},
+                "in": {"$let": {
+                    "vars": window,
+                    "in": {"$let": {
+                        "vars": {"start": {"$max": [{"$subtract": ["$$lo", "$$first"]}, 0]},
+                                 "end": {"$min": [{"$subtract": ["$$hi", "$$first"]}, "$$size"]}},
+                        "in": {"$cond": [{"$gt": ["$$end", "$$start"]},
+                                         {"$slice": ["$$turns", "$$start", {"$max": [{"$subtract": ["$$end", "$$start"]}, 1]}]},
+                                         []]}
+                    }}
+                }}
+            }}
+        }}
+
+
+    async def read_chat_history_page(self, query_types:tuple = ('document', 'web'), before:int = None, after:int = None, limit:int = None):
+        """
+            Function to read a page of chat history of several types with one projection, see chatHistoryWindow for the cursors.
+            Only the turns of the page leave the server, turns older than the chatHistory document are read from the archive
+
+            Args:
+                query_types (tuple, optional): chat history types to read. Defaults to ('document', 'web').
+                before (int, optional): only turns older than this sequence number
+                after (int, optional): only turns newer than this sequence number
+                limit (int, optional): maximum number of turns per type
+
+            Returns:
+                dictionary in the format {type: {turns: list, start: int, end: int, total: int}}
+        """
+        projection = {"_id": 0}
+        for query_type in query_types:
+            turns = {"$ifNull": [f"${query_type}", []]}
+            projection[query_type] = self._chat_history_window_projection(query_type, before, after, limit)
+            projection[f"{query_type}Seq"] = {"$ifNull": [f"${query_type}Seq", {"$size": turns}]}
+            projection[f"{query_type}Size"] = {"$size": turns}
+
+        chatHistory = await self.database.chatHistory.find_one({'_id': self.chatHistoryID}, projection)
+        if not chatHistory:
+            raise HTTPException(status_code=422,detail="ChatHistory Document unfound in Database")
+
+        pages = {}
+        archive_reads = {}
+        for query_type in query_types:
+            total = chatHistory[f"{query_type}Seq"]
+            first = total - chatHistory[f"{query_type}Size"]
+            start, end = chatHistoryWindow(total, before, after, limit)
+            pages[query_type] = {"turns": chatHistory[query_type], "start": start, "end": end, "total": total}
+            if start < first:
+                archive_reads[query_type] = self.read_chat_archive_range(query_type, start, min(end, first))
+
+        archived = await asyncio.gather(*archive_reads.values())
+        for query_type, turns in zip(archive_reads.keys(), archived):
+            pages[query_type]["turns"] = turns + pages[query_type]["turns"]
+        return pages
+
+
+    async def read_full_chat_history(self, query_type:str):
+        """
+            Function to read the whole chat history, archived turns followed by the turns in the chatHistory document
+
+            Args:
+                query_type (string): only web/document
+
+            Returns:
+                list of turns in the format [{'user': query, 'assistant': gpt response}]
+        """
+        # the document is read first, turns trimmed from it afterwards are already in the archive
+        chatHistory = await self.read_MongoDB('chatHistory', chat_history_type=query_type)
+        turns = chatHistory.get(query_type, [])
+        archived = await self.read_chat_archive(query_type, before=chatHistory.get(f"{query_type}Seq", len(turns)) - len(turns))
+        return archived + turns
+
+
+    async def read_chat_summary(self, query_type:str):
+        """
+            Function to read the rolling summary of a chat history
+
+            Args:
+                query_type (string): only web/document
+
+            Returns:
+                dictionary in the format {summary: str, end: sequence number of the first turn not in the summary}
+        """
+        chatHistory = await self.database.chatHistory.find_one({'_id': self.chatHistoryID}, {f"{query_type}Summary": 1, "_id": 0})
+        if chatHistory == None:
+            raise HTTPException(status_code=422,detail="ChatHistory Document unfound in Database")
+        return chatHistory.get(f"{query_type}Summary") or {"summary": None, "end": 0}
+
+
+    async def update_chat_summary(self, query_type:str, summary:str, end:int, previous_end:int):
+        """
+            Function to replace the rolling summary of a chat history, only if nobody else replaced it since it was read
+
+            Args:
+                query_type (string): only web/document
+                summary (string): new summary
+                end (int): sequence number of the first turn not in the new summary
+                previous_end (int): end of the summary the new one was written from
+
+            Returns:
+                True if the summary was replaced
+        """
+        summary_field = f"{query_type}Summary"
+        if previous_end == 0:
+            filter_query = {"_id": self.chatHistoryID, "$or": [{summary_field: {"$exists": False}}, {f"{summary_field}.end": 0}]}
+        else:
+            filter_query = {"_id": self.chatHistoryID, f"{summary_field}.end": previous_end}
+        update = await self.database.chatHistory.update_one(filter_query, {"$set": {summary_field: {"summary": summary, "end": end}}})
+        return update.modified_count > 0
+
+
     async def update_chat_history(self, chat_history:dict, query_type:str):
         """
             Function to update the chatHistory collection with the next set of prompt and response
+            With CHAT_HISTORY_CAP set, only the newest turns are kept in the chatHistory document and older turns are moved
+            to the chatHistoryArchive collection, keyed by chatHistoryID, type and sequence number
 
             Args:
                 chat_history (dictionary): in the format of {'user': query, 'assistant': gpt response} 
@@ -290,18 +654,73 @@ class MongoDBManager():
             raise HTTPException(status_code=422,detail="Invalid Database Collection Name")
 
         filter_query = {"_id": self.chatHistoryID}
+        cap = os.environ.get('CHAT_HISTORY_CAP')
+        if cap:
+            return await self._update_capped_chat_history(chat_history, query_type, int(cap))
+
         update_operation = {
             "$push": {
                 query_type: chat_history
             }
         }
-        update = self.database.chatHistory.update_one(filter_query, update_operation)
+        update = await self.database.chatHistory.update_one(filter_query, update_operation)
         if not update.acknowledged:
             raise HTTPException(status_code=422,detail="Unable to update chat history")
 
         return {'status': 200}
 
 
+    async def _update_capped_chat_history(self, chat_history:dict, query_type:str, cap:int, max_retries:int = 5):
+        """
+            Append a turn, keep the newest cap turns in the document and archive the evicted ones.
+            {type}Seq counts every turn ever appended, so the turn at index i of the array has sequence number {type}Seq - len(array) + i
+            The evicted turns are archived before the document is trimmed, so a turn is always in the document, the archive or both
+            (readers only take archived turns below the first sequence number of the document). The trim only applies if no other turn
+            was appended since the read, otherwise the append is retried; archiving a turn twice hits the unique seq index and is ignored
+        """
+        seq_field = f"{query_type}Seq"
+        turns = {"$ifNull": [f"${query_type}", []]}
+        update_pipeline = [{
+            "$set": {
+                query_type: {"$slice": [{"$concatArrays": [turns, [{"$literal": chat_history}]]}, -cap]},
+                seq_field: {"$add": [{"$ifNull": [f"${seq_field}", {"$size": turns}]}, 1]}
+            }
+        }]
+
+        for attempt in range(max_retries):
+            current = await self.database.chatHistory.find_one({"_id": self.chatHistoryID}, {query_type: 1, seq_field: 1, "_id": 0})
+            if current == None:
+                raise HTTPException(status_code=422,detail="Unable to update chat history")
+
+            current_turns = current.get(query_type) or []
+            seq = current.get(seq_field)
+            first_seq = (seq if seq != None else len(current_turns)) - len(current_turns)
+            evicted = len(current_turns) + 1 - cap
+            if evicted > 0:
+                await self._archive_chat_turns(query_type, first_seq, current_turns[:evicted])
+
+            filter_query = {"_id": self.chatHistoryID, seq_field: seq if seq != None else {"$exists": False}}
+            update = await self.database.chatHistory.update_one(filter_query, update_pipeline)
+            if update.matched_count > 0:
+                return {'status': 200}
+
+        raise HTTPException(status_code=422,detail="Unable to update chat history")
+
+
+    async def _archive_chat_turns(self, query_type:str, first_seq:int, turns:list):
+        """
+            Write turns to chatHistoryArchive, turns already archived by an earlier attempt are skipped by the unique seq index
+        """
+        try:
+            await self.database.chatHistoryArchive.insert_many([
+                {"chatHistoryID": self.chatHistoryID, "type": query_type, "seq": first_seq + i, "turn": turn}
+                for i, turn in enumerate(turns)
+            ], ordered=False)
+        except BulkWriteError as e:
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])) or e.details.get('writeConcernErrors'):
+                raise HTTPException(status_code=422,detail="Unable to archive chat history")
+
+
     async def clear_chat_history(self, query_type:str):
         """
             Function to delete and clear chat history and replace with []
@@ -319,9 +738,16 @@ class MongoDBManager():
         update_operation = {
             "$set": {
                 query_type: []
+            },
+            "$unset": {
+                f"{query_type}Seq": "",
+                f"{query_type}Summary": ""
             }
         }
-        update = self.database.chatHistory.update_one(filter_query, update_operation)
+        update, archive = await asyncio.gather(
+                                self.database.chatHistory.update_one(filter_query, update_operation),
+                                self.database.chatHistoryArchive.delete_many({"chatHistoryID": self.chatHistoryID, "type": query_type})
+                            )
         if not update.acknowledged:
             raise HTTPException(status_code=422,detail="Unable to clear chat history")
 
@@ -342,7 +768,9 @@ class MongoDBManager():
         """
         if collection_name != 'minutes' and collection_name != 'chatHistory':
             raise HTTPException(status_code=422,detail="Invalid Database Collection Name")
-        result = self.database[collection_name].delete_one({'_id': ObjectId(document_id)})
+        result = await self.database[collection_name].delete_one({'_id': ObjectId(document_id)})
+        if collection_name == 'chatHistory':
+            await self.database.chatHistoryArchive.delete_many({'chatHistoryID': ObjectId(document_id)})
         if result.deleted_count != 1:
             raise HTTPException(status_code=422,detail="Unable to delete document")
         
@@ -363,7 +791,9 @@ class MongoDBManager():
         if collection_name != 'minutes' and collection_name != 'chatHistory':
             raise HTTPException(status_code=422,detail="Invalid Database Collection Name")
 
-        result = self.database[collection_name].delete_many({})
+        result = await self.database[collection_name].delete_many({})
+        if collection_name == 'chatHistory':
+            await self.database.chatHistoryArchive.delete_many({})
         return {"status": 200}
 
 
@@ -0,0 +1,164 @@
+import asyncio
+
+
+async def finishUninterrupted(future):
+    """
+        Wait for a future to finish even if the current task is cancelled meanwhile.
+        Used for database writes that must not be abandoned half way when a newer request supersedes the current one
+
+        Args:
+            future (asyncio.Future): future to wait for
+
+        Returns:
+            result of the future, CancelledError is raised afterwards if the task was cancelled while waiting
+    """
+    cancelled = False
+    while not future.done():
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancelled = True
+
+    if cancelled:
+        raise asyncio.CancelledError()
+    return future.result()
+
+
+
+class Flight():
+    def __init__(self):
+        """
+            State of one key in the SingleFlightScheduler
+        """
+        self.factory = None
+        self.waiters = []
+        self.first_submit = None
+        self.last_submit = None
+        self.wakeup = asyncio.Event()
+        self.driver = None
+        self.running = None
+        self.cancel_requested = False
+
+
+
+class SingleFlightScheduler():
+
+    def __init__(self, debounce_ms:int = 300, max_wait_ms:int = 2000):
+        """
+            Per key single flight scheduler with latest wins semantics.
+            Bursts of submissions for the same key are debounced, a submission arriving while the key is running cancels the
+            superseded run, and every caller waiting on the key is answered with the result of the newest submission
+
+            Args:
+                debounce_ms (int, optional): quiet time after the last submission before running. Defaults to 300.
+                max_wait_ms (int, optional): upper bound on the debounce so continuous submissions still run. Defaults to 2000.
+        """
+        self.debounce = debounce_ms / 1000
+        self.max_wait = max_wait_ms / 1000
+        self.flights = {}
+        self.submitted = 0
+        self.executed = 0
+        self.superseded = 0
+
+
+    async def submit(self, key, factory):
+        """
+            Submit work for a key
+
+            Args:
+                key (hashable): work with the same key is coalesced, eg. (minutesID, topicID)
+                factory (callable): function returning the coroutine to run
+
+            Returns:
+                result of the newest submission for the key
+        """
+        loop = asyncio.get_running_loop()
+        flight = self.flights.get(key)
+        if flight == None:
+            flight = Flight()
+            self.flights[key] = flight
+
+        now = loop.time()
+        flight.factory = factory
+        flight.last_submit = now
+        if flight.first_submit == None:
+            flight.first_submit = now
+        waiter = loop.create_future()
+        flight.waiters.append(waiter)
+        self.submitted += 1
+
+        # newer input makes the running call stale
+        if flight.running != None and not flight.running.done() and not flight.cancel_requested:
+            flight.cancel_requested = True
+            flight.running.cancel()
+            self.superseded += 1
+
+        flight.wakeup.set()
+        if flight.driver == None:
+            flight.driver = asyncio.create_task(self._drive(key, flight))
+
+        return await asyncio.shield(waiter)
+
+
+    async def _drive(self, key, flight:Flight):
+        """
+            Runs the newest submission of a key until no submission is left, then removes the key
+        """
+        loop = asyncio.get_running_loop()
+        while flight.factory != None:
+            # debounce until the key has been quiet long enough or waited too long
+            while True:
+                flight.wakeup.clear()
+                remaining = min(flight.last_submit + self.debounce, flight.first_submit + self.max_wait) - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(flight.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            factory = flight.factory
+            waiters = flight.waiters
+            flight.factory = None
+            flight.waiters = []
+            flight.first_submit = None
+            flight.cancel_requested = False
+            flight.running = asyncio.ensure_future(factory())
+            self.executed += 1
+
+            await asyncio.wait({flight.running})
+            task = flight.running
+            flight.running = None
+
+            if task.cancelled() or flight.factory != None:
+                # superseded, its callers wait for the newer run
+                flight.waiters = waiters + flight.waiters
+                if not task.cancelled():
+                    task.exception()
+                continue
+
+            for waiter in waiters:
+                if waiter.done():
+                    continue
+                if task.exception() != None:
+                    waiter.set_exception(task.exception())
+                else:
+                    waiter.set_result(task.result())
+
+        del self.flights[key]
+
+
+    def stats(self):
+        """
+            Scheduler metrics
+
+            Returns:
+                dictionary of submitted, executed and superseded runs
+        """
+        return {
+            "submitted": self.submitted,
+            "executed": self.executed,
+            "superseded": self.superseded,
+            "coalesced": self.submitted - self.executed,
+            "active_keys": len(self.flights)
+        }
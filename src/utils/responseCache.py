@@ -0,0 +1,225 @@
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def responseCacheKey(model:str, temperature:float, messages:list):
+    """
+        Cache key of a chat completion, hash of (model, temperature, messages)
+
+        Args:
+            model (str): name of the model
+            temperature (float): temperature of the model
+            messages (list): messages sent to the model
+
+        Returns:
+            hex digest string
+    """
+    payload = json.dumps({"model": model, "temperature": temperature, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+
+class ResponseCache():
+
+    # backends doing blocking I/O are run in a worker thread by aget / aset
+    blocking = False
+
+    def __init__(self, ttl:float = 3600, max_size:int = 1000):
+        """
+            Base class of the GPT response cache, keeps the metrics. Backends implement _get, _set and _size
+
+            Args:
+                ttl (float, optional): seconds before an entry expires. Defaults to 3600.
+                max_size (int, optional): maximum number of entries, least recently used are evicted first. Defaults to 1000.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_latency = 0.0
+        self.callers = {}
+
+
+    def get(self, key:str, caller:str = None):
+        """
+            Retrieve a cached response
+
+            Args:
+                key (str): key from responseCacheKey
+                caller (str, optional): name of the calling function, used for the per caller metrics
+
+            Returns:
+                response string or None if missing / expired
+        """
+        with self.lock:
+            entry = self._get(key, time.time())
+            caller_stats = self.callers.setdefault(caller, {"hits": 0, "misses": 0})
+            if entry == None:
+                self.misses += 1
+                caller_stats["misses"] += 1
+                return None
+
+            response, latency = entry
+            self.hits += 1
+            self.saved_latency += latency
+            caller_stats["hits"] += 1
+            return response
+
+
+    def set(self, key:str, response:str, latency:float):
+        """
+            Store a response
+
+            Args:
+                key (str): key from responseCacheKey
+                response (str): GPT response
+                latency (float): seconds the upstream call took, added to the saved latency on every hit
+        """
+        with self.lock:
+            self._set(key, response, latency, time.time())
+
+
+    async def aget(self, key:str, caller:str = None):
+        """
+            get for the event loop, blocking backends are queried in a worker thread
+        """
+        if self.blocking:
+            return await asyncio.to_thread(self.get, key, caller)
+        return self.get(key, caller)
+
+
+    async def aset(self, key:str, response:str, latency:float):
+        """
+            set for the event loop, blocking backends are written in a worker thread
+        """
+        if self.blocking:
+            return await asyncio.to_thread(self.set, key, response, latency)
+        return self.set(key, response, latency)
+
+
+    def stats(self):
+        """
+            Cache metrics
+
+            Returns:
+                dictionary of hits, misses, hit ratio, saved upstream latency and per caller counts
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_latency_ms": round(self.saved_latency * 1000, 1),
+                "entries": self._size(),
+                "evictions": self.evictions,
+                "callers": {str(caller): dict(counts) for caller, counts in self.callers.items()}
+            }
+
+
+
+class InMemoryResponseCache(ResponseCache):
+
+    def __init__(self, ttl:float = 3600, max_size:int = 1000):
+        """
+            In process LRU backend
+        """
+        super().__init__(ttl, max_size)
+        self.entries = OrderedDict()
+
+
+    def _get(self, key:str, now:float):
+        entry = self.entries.get(key)
+        if entry == None:
+            return None
+        response, latency, created = entry
+        if now - created > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response, latency
+
+
+    def _set(self, key:str, response:str, latency:float, now:float):
+        self.entries[key] = (response, latency, now)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def _size(self):
+        return len(self.entries)
+
+
+
+class SQLiteResponseCache(ResponseCache):
+
+    blocking = True
+
+    def __init__(self, path:str, ttl:float = 3600, max_size:int = 1000, access_batch:int = 100):
+        """
+            On disk sqlite backend, survives restarts.
+            Reads do not write, the access times used for LRU eviction are kept in memory and written with the next set
+            or once access_batch of them are waiting, expired rows are removed on set
+
+            Args:
+                path (str): path of the sqlite database file
+                access_batch (int, optional): number of pending access times written in one commit. Defaults to 100.
+        """
+        super().__init__(ttl, max_size)
+        self.access_batch = access_batch
+        self.pending_access = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                    key TEXT PRIMARY KEY,
+                                    response TEXT NOT NULL,
+                                    latency REAL NOT NULL,
+                                    created REAL NOT NULL,
+                                    accessed REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.connection.commit()
+
+
+    def _get(self, key:str, now:float):
+        row = self.connection.execute("SELECT response, latency, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row == None:
+            return None
+        response, latency, created = row
+        if now - created > self.ttl:
+            return None
+        self.pending_access[key] = now
+        if len(self.pending_access) >= self.access_batch:
+            self._write_access()
+            self.connection.commit()
+        return response, latency
+
+
+    def _write_access(self):
+        self.connection.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                    [(accessed, key) for key, accessed in self.pending_access.items()])
+        self.pending_access = {}
+
+
+    def _set(self, key:str, response:str, latency:float, now:float):
+        self._write_access()
+        self.connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.connection.execute("INSERT OR REPLACE INTO responses (key, response, latency, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                                (key, response, latency, now, now))
+        overflow = self._size() - self.max_size
+        if overflow > 0:
+            self.connection.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)", (overflow,))
+            self.evictions += overflow
+        self.connection.commit()
+
+
+    def _size(self):
+        return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def normaliseRows(vectors):
+    """
+        Scale every row to unit length so that a dot product is the cosine similarity
+
+        Args:
+            vectors (list or np.ndarray): matrix of embeddings, one per row
+
+        Returns:
+            float32 np.ndarray of unit rows
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def topicCoherenceScore(sentence_vectors, newest_indices:list):
+    """
+        Cosine similarity of the newest sentences against the centroid of the rest of the topic.
+        Each newest sentence is compared with the centroid of every other sentence (leave one out), so a topic made only of new
+        sentences is still scored fairly. The lowest similarity is returned as the least coherent sentence decides.
+
+        Args:
+            sentence_vectors (list or np.ndarray): embeddings of every sentence of the topic, in order
+            newest_indices (list): indices of the newest sentences
+
+        Returns:
+            float cosine similarity between -1 and 1
+    """
+    matrix = normaliseRows(sentence_vectors)
+    if len(matrix) < 2 or len(newest_indices) == 0:
+        return 1.0
+
+    newest = matrix[newest_indices]
+    centroids = (matrix.sum(axis=0) - newest) / (len(matrix) - 1)
+    centroids = normaliseRows(centroids)
+    similarities = np.einsum('ij,ij->i', newest, centroids)
+    return float(similarities.min())
+
+
+def agendaMatchScore(sentence_vectors, agenda_vectors:list):
+    """
+        Cosine similarity of the minutes centroid against every agenda item in one matrix product
+
+        Args:
+            sentence_vectors (list or np.ndarray): embeddings of every sentence of the topic
+            agenda_vectors (list): embeddings of the agenda items, None for empty items
+
+        Returns:
+            tuple of (best cosine similarity, index of the best matching agenda item)
+    """
+    indices = [i for i, vector in enumerate(agenda_vectors) if vector is not None]
+    if len(indices) == 0:
+        return 0.0, None
+
+    centroid = normaliseRows(normaliseRows(sentence_vectors).mean(axis=0, keepdims=True))[0]
+    similarities = normaliseRows([agenda_vectors[i] for i in indices]) @ centroid
+    best = int(similarities.argmax())
+    return float(similarities[best]), indices[best]
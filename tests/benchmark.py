@@ -0,0 +1,186 @@
+import time
+import requests
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class APIBenchmark():
+
+    def __init__(self, url:str = "http://localhost:8000") -> None:
+        """
+        Initiate endpoint URL and document IDs used for benchmarking
+        Run the same benchmark against the service before and after a change to compare the numbers
+
+        Args:
+            url (str): base url of the running service
+        """
+        self.url = url
+        r = requests.get(self.url + "/create")
+        document_ids = r.json()
+        self.minutesID = document_ids['minutesID']
+        self.chatHistoryID = document_ids['chatHistoryID']
+        self.extra_documents = []
+
+
+    def _run(self, endpoint:str, payloads:list, concurrency:int):
+        """
+        Fire all payloads at the endpoint with a fixed number of concurrent clients
+
+        Args:
+            endpoint (str): endpoint to benchmark, eg. /read_glossary
+            payloads (list): list of json bodies, one per request
+            concurrency (int): number of concurrent clients
+
+        Returns:
+            dictionary in the format {endpoint: str, requests: int, errors: int, seconds: float, requests_per_sec: float}
+        """
+        url = self.url + endpoint
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        session.mount("http://", adapter)
+
+        def post(payload):
+            return session.post(url, json=payload).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            status_codes = list(executor.map(post, payloads))
+        elapsed = time.perf_counter() - start
+
+        result = {"endpoint": endpoint,
+                  "requests": len(payloads),
+                  "errors": len([code for code in status_codes if code != 200]),
+                  "seconds": round(elapsed, 3),
+                  "requests_per_sec": round(len(payloads) / elapsed, 2)}
+        print(result)
+        return result
+
+    #--------------------------------------------------------------------------------
+    #         MongoDB Endpoints
+    #--------------------------------------------------------------------------------
+
+    async def read_glossary(self, total_requests:int = 500, concurrency:int = 20):
+        """
+        Requests/sec on /read_glossary, which is a single MongoDB read
+
+        Args:
+            total_requests (int): number of requests sent
+            concurrency (int): number of concurrent clients
+        """
+        payloads = [{"minutesID": self.minutesID, "chatHistoryID": self.chatHistoryID} for i in range(total_requests)]
+        return self._run("/read_glossary", payloads, concurrency)
+
+
+    async def track_minutes(self, total_requests:int = 50, concurrency:int = 10):
+        """
+        Requests/sec on /track_minutes, every request edits the last bulletpoint of its own topic
+
+        Args:
+            total_requests (int): number of requests sent
+            concurrency (int): number of concurrent clients
+        """
+        minutes = "finish frontend by wednesday\nconsult kenny for the web experiment\nconduct study on friday"
+        payloads = [{"topicTitle": f"topic {i % concurrency}",
+                     "topicID": str(i % concurrency),
+                     "abbreviation": None,
+                     "minutes": minutes + f"\nfollow up item {i}",
+                     "minutesID": self.minutesID,
+                     "chatHistoryID": self.chatHistoryID} for i in range(total_requests)]
+        return self._run("/track_minutes", payloads, concurrency)
+
+
+    def _fill_meeting(self, session, minutesID:str, chatHistoryID:str, topics:int):
+        """
+        Write one topic per /track_minutes call into a meeting
+
+        Args:
+            session (requests.Session): session used for the requests
+            minutesID (str): minutes document of the meeting
+            chatHistoryID (str): chat history document of the meeting
+            topics (int): number of topics written
+        """
+        for i in range(topics):
+            session.post(self.url + "/track_minutes", json={"topicTitle": f"topic {i}", "topicID": str(i), "abbreviation": None,
+                                                             "minutes": f"finish item {i} by wednesday\nconsult kenny on item {i}",
+                                                             "minutesID": minutesID, "chatHistoryID": chatHistoryID})
+
+
+    def _stream_summarise_all(self, session, minutesID:str, chatHistoryID:str):
+        """
+        Time one streamed /summarise_all call
+
+        Returns:
+            tuple of (number of summaries, seconds until the stream ends, seconds until the first summary)
+        """
+        start = time.perf_counter()
+        first_summary = None
+        summaries = 0
+        with session.post(self.url + "/summarise_all", json={"minutesID": minutesID, "chatHistoryID": chatHistoryID}, stream=True) as r:
+            for line in r.iter_lines(decode_unicode=True):
+                if line == "event: summary":
+                    summaries += 1
+                    if first_summary == None:
+                        first_summary = time.perf_counter() - start
+        return summaries, time.perf_counter() - start, first_summary
+
+
+    async def summarise_all(self, topics:int = 20):
+        """
+        Wall clock time to summarise a meeting with one /summarise call per topic (sequential, as the frontend does today)
+        against a single streamed /summarise_all call.
+        Summaries are cached on the topic, so /summarise_all runs on a second meeting with the same minutes to compare cold calls,
+        then once more on that meeting to report the cache hit case on its own
+
+        Args:
+            topics (int): number of topics in the meeting
+        """
+        session = requests.Session()
+        self._fill_meeting(session, self.minutesID, self.chatHistoryID, topics)
+        document_ids = session.get(self.url + "/create").json()
+        self.extra_documents.append(document_ids)
+        self._fill_meeting(session, document_ids['minutesID'], document_ids['chatHistoryID'], topics)
+
+        start = time.perf_counter()
+        for i in range(topics):
+            session.post(self.url + "/summarise", json={"topicID": str(i), "minutesID": self.minutesID, "chatHistoryID": self.chatHistoryID})
+        sequential = time.perf_counter() - start
+
+        summaries, batched, first_summary = self._stream_summarise_all(session, document_ids['minutesID'], document_ids['chatHistoryID'])
+        cached_summaries, cached, cached_first_summary = self._stream_summarise_all(session, document_ids['minutesID'], document_ids['chatHistoryID'])
+
+        result = {"topics": topics,
+                  "summaries": summaries,
+                  "sequential_seconds": round(sequential, 3),
+                  "summarise_all_seconds": round(batched, 3),
+                  "summarise_all_first_summary_seconds": round(first_summary, 3) if first_summary != None else None,
+                  "cached_summaries": cached_summaries,
+                  "cached_summarise_all_seconds": round(cached, 3),
+                  "cached_summarise_all_first_summary_seconds": round(cached_first_summary, 3) if cached_first_summary != None else None}
+        print(result)
+        return result
+
+
+    def cleanup(self):
+        """
+        Remove the benchmark documents from the database
+        """
+        meetings = [{"minutesID": self.minutesID, "chatHistoryID": self.chatHistoryID}] + self.extra_documents
+        for document_ids in meetings:
+            data = {"collectionName": "minutes", "documentID": None, **document_ids}
+            requests.post(self.url + "/delete_document", json=data)
+            data["collectionName"] = "chatHistory"
+            requests.post(self.url + "/delete_document", json=data)
+
+
+
+async def benchmark():
+    benchmarkManager = APIBenchmark()
+    try:
+        await benchmarkManager.read_glossary()
+        await benchmarkManager.track_minutes()
+        await benchmarkManager.summarise_all()
+    finally:
+        benchmarkManager.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
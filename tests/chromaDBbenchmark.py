@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import asyncio
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils import chromaDBManager
+from utils.chromaDBManager import ChromaDBManager
+
+
+class RoundTripCounter():
+    """
+    Counts the HTTP requests the chroma client sends by wrapping requests.Session.request
+    """
+    def __init__(self):
+        self.count = 0
+        self._request = requests.Session.request
+
+    def __enter__(self):
+        counter = self
+        original = self._request
+
+        def counting_request(session, *args, **kwargs):
+            counter.count += 1
+            return original(session, *args, **kwargs)
+
+        requests.Session.request = counting_request
+        return self
+
+    def __exit__(self, *exc):
+        requests.Session.request = self._request
+
+
+
+async def ManagerSetupBenchmark(collection_name:str = 'benchmark_collection', total_requests:int = 200):
+    """
+    Round trips and latency spent constructing ChromaDBManager, once with the collection cache cleared before every request
+    (what every request paid before handles were cached) and once with the shared cache
+
+    Args:
+        collection_name (str): collection used for the benchmark, deleted at the end
+        total_requests (int): number of simulated requests
+    """
+    results = {}
+    for mode in ['uncached', 'cached']:
+        chromaDBManager.invalidateCollection()
+        with RoundTripCounter() as counter:
+            start = time.perf_counter()
+            for i in range(total_requests):
+                if mode == 'uncached':
+                    chromaDBManager.invalidateCollection()
+                ChromaDBManager(collection_name)
+            elapsed = time.perf_counter() - start
+
+        results[mode] = {"round_trips_per_request": counter.count / total_requests,
+                         "ms_per_request": round(elapsed * 1000 / total_requests, 3)}
+        print(mode, results[mode])
+
+    saved = results['uncached']['round_trips_per_request'] - results['cached']['round_trips_per_request']
+    print(f"saved round trips per request: {saved}")
+    ChromaDBManager(collection_name).delete_collection(collection_name)
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(ManagerSetupBenchmark())
@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import chromadb
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+from utils import gptManager, chromaDBManager
+from utils.chromaDBManager import ChromaDBManager
+from utils.contextBuilder import countTokens
+from utils.embeddingCache import EmbeddingCache, CachedEmbeddingFunction
+from trackerBenchmark import HashingEmbeddingFunction
+from streamingBenchmark import FakeStreamingServer
+
+
+# topic title, words the filler sentences of the topic are made of
+FIXTURE_TOPICS = [
+    ("Budget", ["budget", "finance", "quarter", "spending", "forecast", "campaign", "invoice", "costs", "payroll", "savings", "audit", "approval", "headcount", "tooling"]),
+    ("Hiring", ["hiring", "interview", "candidate", "engineer", "recruiter", "offer", "panel", "onboarding", "referral", "salary", "intern", "role", "pipeline", "feedback"]),
+    ("Release", ["release", "qa", "bug", "version", "rollout", "testing", "hotfix", "build", "changelog", "regression", "staging", "flag", "checklist", "review"]),
+    ("Infrastructure", ["server", "cluster", "database", "latency", "backup", "migration", "storage", "network", "alerts", "capacity", "failover", "dns", "patching", "logs"]),
+    ("Marketing", ["launch", "social", "press", "brand", "webinar", "newsletter", "ads", "audience", "blog", "video", "partners", "event", "survey", "seo"]),
+    ("Operations", ["office", "vendor", "contract", "facilities", "travel", "laptops", "security", "badges", "cleaning", "parking", "desks", "catering", "insurance", "mail"]),
+]
+
+# (topic title, fact written in the middle of the topic, question about it)
+FIXTURE_FACTS = [
+    ("Budget", "Finance approved an extra 12k for the webinar campaign in March.", "How much extra did finance approve for the webinar campaign?"),
+    ("Hiring", "The offer to the senior engineer candidate expires on Friday.", "When does the offer to the senior engineer expire?"),
+    ("Release", "The hotfix for the payment bug ships in version 2.3.1.", "Which version ships the payment bug hotfix?"),
+    ("Infrastructure", "The database migration to the new cluster is scheduled for Sunday night.", "When is the database migration scheduled?"),
+    ("Operations", "The cleaning vendor contract renews automatically in July.", "When does the cleaning vendor contract renew?"),
+]
+
+NAMES = ["Alice", "Ben", "Chloe", "Dev", "Elena", "Farid", "Grace", "Hiro"]
+VERBS = ["said", "noted", "asked whether", "confirmed", "raised that", "suggested"]
+
+
+def fixtureMeeting(sentences_per_topic:int = 150, seed:int = 7):
+    """
+    Long meeting minutes, every topic is filler sentences from its vocabulary with one fact in the middle
+
+    Returns:
+        dictionary in the format {topicID: (topic title, list of sentences)}
+    """
+    generator = random.Random(seed)
+    facts = {title: fact for title, fact, question in FIXTURE_FACTS}
+    meeting = {}
+    for topic_index, (title, words) in enumerate(FIXTURE_TOPICS):
+        sentences = []
+        for i in range(sentences_per_topic):
+            picked = generator.sample(words, 4)
+            sentences.append(f"{generator.choice(NAMES)} {generator.choice(VERBS)} the {picked[0]} {picked[1]} needs follow up on the {picked[2]} and {picked[3]}.")
+        if title in facts:
+            sentences[sentences_per_topic // 2] = facts[title]
+        meeting[f"topic{topic_index}"] = (title, sentences)
+    return meeting
+
+
+
+class PrefillStreamingServer(FakeStreamingServer):
+
+    def __init__(self, prefill_ms_per_1k_tokens:float = 40, **kwargs):
+        """
+        FakeStreamingServer whose first token waits longer for longer prompts, like the model reading the prompt before answering
+
+        Args:
+            prefill_ms_per_1k_tokens (float): extra delay before the first token per 1000 prompt tokens
+        """
+        super().__init__(**kwargs)
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+
+
+    async def handler(self, request):
+        body = await request.json()
+        prompt_tokens = sum(countTokens(message['content']) for message in body['messages'])
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep((self.first_token_ms + self.prefill_ms_per_1k_tokens * prompt_tokens / 1000) / 1000)
+
+        for i in range(self.tokens):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': f" tok{i}"}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.token_interval_ms / 1000)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+
+
+async def loadFixtureMeeting(sentences_per_topic:int = 150):
+    """
+    Write the fixture meeting into an in memory chroma collection embedded with the offline hashing embedding
+
+    Returns:
+        ChromaDBManager of the fixture meeting
+    """
+    chromaDBManager.chromaClient = chromadb.EphemeralClient()
+    chromaDBManager.embeddingFunction = CachedEmbeddingFunction(HashingEmbeddingFunction(), EmbeddingCache('benchmark'))
+    chromaDBManager.invalidateCollection()
+    if 'context_benchmark' in [collection.name for collection in chromaDBManager.chromaClient.list_collections()]:
+        chromaDBManager.chromaClient.delete_collection('context_benchmark')
+    # the hashing embedding has many ties, a wider HNSW search keeps the nearest hits exact so only the context building is compared
+    chromaDBManager.chromaClient.create_collection('context_benchmark', metadata={"hnsw:search_ef": 200})
+    chromaDB = ChromaDBManager('context_benchmark')
+    for topic_id, (title, sentences) in fixtureMeeting(sentences_per_topic).items():
+        sentence_ids = [f"{topic_id}-{i}" for i in range(len(sentences))]
+        await chromaDB.update_embeddings(dict(zip(sentence_ids, sentences)), topic_id, title, sentence_ids)
+    return chromaDB
+
+
+async def measureContext(chromaDB, k:int, token_budget:int = None, window:int = None, max_distance:float = None):
+    """
+    Ask every fixture question through query_collection, documentQuery and streamGPTQuery
+
+    Returns:
+        dictionary of prompt tokens, fetched sentences, reconstruction and first token time, and how often the answer is in the context
+    """
+    prompt_tokens = []
+    fetched_sentences = []
+    reconstruction = []
+    first_tokens = []
+    found = 0
+    for title, fact, question in FIXTURE_FACTS:
+        unique_parent_topics, context_dict = await chromaDB.query_collection(question, k, token_budget, window, max_distance)
+        query_message = await gptManager.documentQuery(question, context_dict)
+        prompt_tokens.append(countTokens(query_message[0]['content']))
+        fetched_sentences.append(chromaDB.query_timings['fetched_sentences'])
+        reconstruction.append(chromaDB.query_timings['reconstruction_ms'])
+        found += any(fact in text for text in context_dict.values())
+
+        start = time.perf_counter()
+        first_token = None
+        response = await gptManager.streamGPTQuery(query_message, user_query=question, type='document')
+        async for event in response.body_iterator:
+            if first_token == None:
+                first_token = time.perf_counter() - start
+        first_tokens.append(first_token)
+
+    return {"mean_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens)),
+            "max_prompt_tokens": max(prompt_tokens),
+            "mean_fetched_sentences": round(sum(fetched_sentences) / len(fetched_sentences), 1),
+            "mean_reconstruction_ms": round(sum(reconstruction) / len(reconstruction), 2),
+            "mean_time_to_first_token_ms": round(1000 * sum(first_tokens) / len(first_tokens), 1),
+            "answer_in_context": f"{found}/{len(FIXTURE_FACTS)}"}
+
+
+async def ContextBudgetBenchmark(budgets:list = [None, 2000, 800, 400], k:int = 3, sentences_per_topic:int = 150):
+    """
+    Prompt tokens, time to first token and whether the answer is in the context of documentQuery
+    for whole topics (None) and for every token budget, over the fixture meeting.
+    Uses an in memory chroma client, an offline hashing embedding and a streaming server with a prompt dependent first token delay
+
+    Args:
+        budgets (list): DOCUMENT_CONTEXT_TOKENS values, None sends every sentence of the retrieved topics
+        k (int): number of hits of the similarity search
+        sentences_per_topic (int): length of every topic of the fixture meeting
+
+    Returns:
+        dictionary in the format {budget: {...}}
+    """
+    chromaDB = await loadFixtureMeeting(sentences_per_topic)
+    server = PrefillStreamingServer(tokens=20)
+    await server.start()
+    results = {}
+    try:
+        for budget in budgets:
+            results[budget] = await measureContext(chromaDB, k, token_budget=budget)
+            print(f"budget {budget}", results[budget])
+    finally:
+        await gptManager.closeGPTSession()
+        await server.stop()
+    return results
+
+
+async def HitWindowBenchmark(windows:list = [None, 5, 2, 0], k:int = 3, sentences_per_topic:int = 150):
+    """
+    Same measurements as ContextBudgetBenchmark for whole topics (None) and for windows of sentences around the hits
+
+    Args:
+        windows (list): DOCUMENT_CONTEXT_WINDOW values, None fetches every sentence of the retrieved topics
+        k (int): number of hits of the similarity search
+        sentences_per_topic (int): length of every topic of the fixture meeting
+
+    Returns:
+        dictionary in the format {window: {...}}
+    """
+    chromaDB = await loadFixtureMeeting(sentences_per_topic)
+    server = PrefillStreamingServer(tokens=20)
+    await server.start()
+    results = {}
+    try:
+        for window in windows:
+            results[window] = await measureContext(chromaDB, k, window=window)
+            print(f"window {window}", results[window])
+    finally:
+        await gptManager.closeGPTSession()
+        await server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(ContextBudgetBenchmark())
+    asyncio.run(HitWindowBenchmark())
@@ -0,0 +1,113 @@
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils.formatData import *
+from utils.chatHistoryCache import ChatHistoryCache
+
+
+def positionalDiff(existing_sentences:list, text_minutes:str, topic_id:str):
+    """
+    Previous track_minutes comparison, sentences are matched by index so every line after an insertion is seen as changed
+
+    Returns:
+        dictionary in the format of {sentenceID: sentenceText or None if deleted}
+    """
+    formatted_new_minutes = formatTextMinutes(text_minutes, topic_id)
+    formatted_existing_minutes = formatMongoMinutes(existing_sentences)
+    update_dict = {}
+    for sentenceID, new_sentence in formatted_new_minutes.items():
+        if new_sentence != formatted_existing_minutes.get(sentenceID, ''):
+            update_dict[sentenceID] = new_sentence
+    for i in range(len(formatted_new_minutes), len(formatted_existing_minutes)):
+        update_dict[f"{topic_id}-{i}"] = None
+    return update_dict
+
+
+
+def SentenceDiffBenchmark(topic_length:int = 40, topic_id:str = '0'):
+    """
+    Embeddings (sentences with new text) and sentence writes per edit for the positional diff and diffMinutes
+
+    Args:
+        topic_length (int): number of lines in the topic before the edit
+        topic_id (str): topic id of the minutes
+
+    Returns:
+        list of dictionary in the format {scenario: str, positional: {embeddings, writes}, diff: {embeddings, writes}}
+    """
+    lines = [f"bulletpoint number {i}" for i in range(topic_length)]
+    existing_sentences = [{"sentenceID": sentence_id, "sentenceText": text} for sentence_id, text in formatTextMinutes("\n".join(lines), topic_id).items()]
+
+    scenarios = {
+        "insert-at-top": ["new first bulletpoint"] + lines,
+        "append": lines + ["new last bulletpoint"],
+        "delete-middle": lines[:topic_length // 2] + lines[topic_length // 2 + 1:]
+    }
+
+    results = []
+    for scenario, new_lines in scenarios.items():
+        text_minutes = "\n".join(new_lines)
+        positional = positionalDiff(existing_sentences, text_minutes, topic_id)
+        update_dict, sentence_order, moved_positions = diffMinutes(existing_sentences, text_minutes, topic_id)
+
+        result = {"scenario": scenario,
+                  "positional": {"embeddings": len([text for text in positional.values() if text != None]), "writes": len(positional)},
+                  "diff": {"embeddings": len([text for text in update_dict.values() if text != None]), "writes": len(update_dict)}}
+        print(result)
+        results.append(result)
+    return results
+
+
+def slicingFormatChatHistory(chat_history:list):
+    """
+    Previous formatChatHistory, consumes the list with repeated slicing
+    """
+    formatted_chat_history = []
+    chat_history = [chat for chat in chat_history if 'sourcetopicIDs' not in chat]
+
+    while len(chat_history) > 0:
+        formatted_chat_history.append({'role': 'user', 'content': chat_history[0]['user']})
+        formatted_chat_history.append({'role': 'assistant', 'content': chat_history[0]['assistant']})
+        chat_history = chat_history[2:]
+
+    return formatted_chat_history
+
+
+
+def ChatHistoryFormatBenchmark(history_lengths:tuple = (10, 1000, 10000), repeats:int = 5):
+    """
+    Time to build the model context for a new question with the slicing formatter, formatChatHistory
+    and the incremental ChatHistoryCache (one new turn since the last question)
+
+    Args:
+        history_lengths (tuple): number of turns in the chat history
+        repeats (int): number of runs averaged per data point
+
+    Returns:
+        list of dictionary in the format {turns: int, slicing_ms: float, single_pass_ms: float, incremental_ms: float}
+    """
+    results = []
+    for turns in history_lengths:
+        chat_history = [{'user': f"question {i}", 'assistant': f"answer {i}"} for i in range(turns)]
+        cache = ChatHistoryCache()
+        cache.extend(('chatHistoryID', 'web'), 0, turns - 1, chat_history[:-1])
+
+        def incremental():
+            # only the newest turn is formatted, the rest comes from the cache
+            cache.extend(('chatHistoryID', 'web'), turns - 1, turns, chat_history[-1:])
+            return cache.get(('chatHistoryID', 'web'))
+
+        result = {"turns": turns,
+                  "slicing_ms": round(timeit.timeit(lambda: slicingFormatChatHistory(chat_history), number=repeats) * 1000 / repeats, 3),
+                  "single_pass_ms": round(timeit.timeit(lambda: formatChatHistory(chat_history), number=repeats) * 1000 / repeats, 3),
+                  "incremental_ms": round(timeit.timeit(incremental, number=repeats) * 1000 / repeats, 3)}
+        print(result)
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    SentenceDiffBenchmark()
+    ChatHistoryFormatBenchmark()
@@ -0,0 +1,158 @@
+import os
+import sys
+import asyncio
+import chromadb
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+from utils import gptManager, chromaDBManager
+from utils.acronymResolver import resolveAcronym
+from microservice.track_minutes import track_minutes
+from trackerBenchmark import HashingEmbeddingFunction, FakeChatServer
+
+
+GLOSSARY = [{"abbreviation": "OKR", "meaning": "Objectives and Key Results"},
+            {"abbreviation": "PR", "meaning": "Pull Request"}]
+
+# (abbreviation, minutes, expected meaning or None if only GPT can tell, an expansion without a definition cue is left to GPT)
+FIXTURE_CORPUS = [
+    ("SLA", "Vendor agreed to a Service Level Agreement (SLA) of 99.9%.\nSLA breaches are reported monthly.", "Service Level Agreement"),
+    ("KPI", "Each team picks three KPI (Key Performance Indicators) for Q3.", "Key Performance Indicators"),
+    ("DOD", "The Department of Defense contract renews in May.\nDOD wants a demo first.", None),
+    ("ROI", "Marketing expects a better return on investment this year.\nROI report due Friday.", None),
+    ("CTA", "The landing page needs a clearer CTA button, CTA stands for Call To Action.\nCTA copy by design team.", "Call To Action"),
+    ("PP", "Slides will be shared as a PowerPoint deck.\nPP template is on the drive.", None),
+    ("MVP", "We agreed to scope the MVP down to login and search.", None),
+    ("QA", "Quality Assurance (QA) will start on Monday.", "Quality Assurance"),
+    ("OKR", "OKR drafts are due next week.", "Objectives and Key Results"),
+    ("PR", "Please review the PR for the login fix.", "Pull Request"),
+    ("GDPR", "Legal flagged the General Data Protection Regulation for the signup form.", None),
+    ("ETA", "Supplier did not give an ETA for the parts.", None),
+    ("UX", "User Experience research (UX) shows users skip onboarding.", None),
+    ("R&D", "Budget for Research and Development (R&D) is unchanged.\nR&D hires frozen.", "Research and Development"),
+    ("API", "The partner asked for a public API by June.", None),
+    ("CRM", "Sales moves to the new CRM, short for Customer Relationship Management.\nCRM training next month.", "Customer Relationship Management"),
+    ("SOW", "The SOW means statement of work for the vendor.", "statement of work"),
+]
+
+# (abbreviation, minutes) whose capitalised words spell the abbreviation without defining it, must be left to GPT
+FALSE_DEFINITIONS = [
+    ("AI", "Ask Alice. Is the AI demo ready for Friday?"),
+    ("PM", "Please Make sure the PM signs off the plan."),
+    ("CEO", "Chris Emailed Olivia about the CEO visit."),
+    ("ETA", "Everyone Told Alex the ETA slipped to June."),
+]
+
+
+def GlossaryResolutionBenchmark():
+    """
+    Fraction of abbreviations in the fixture corpus resolved without GPT, and how many of those were correct
+
+    Returns:
+        dictionary in the format {abbreviations: int, local: int, local_rate: float, correct: int, by_source: {glossary: int, minutes: int}}
+    """
+    local = 0
+    correct = 0
+    by_source = {"glossary": 0, "minutes": 0}
+    for abbreviation, minutes, expected in FIXTURE_CORPUS:
+        meaning, source = resolveAcronym(abbreviation, minutes, GLOSSARY)
+        print(f"{abbreviation:5} -> {meaning} ({source or 'gpt'})")
+        if meaning != None:
+            local += 1
+            by_source[source] += 1
+            correct += meaning == expected
+
+    results = {"abbreviations": len(FIXTURE_CORPUS),
+               "local": local,
+               "local_rate": round(local / len(FIXTURE_CORPUS), 3),
+               "correct": correct,
+               "by_source": by_source}
+    print(results)
+    return results
+
+
+class InMemoryMinutes():
+
+    def __init__(self, agenda:list, glossary:list):
+        """
+        Stand in for MongoDBManager holding one minutes document, with only the calls track_minutes makes
+        """
+        self.agenda = agenda
+        self.glossary = glossary
+        self.topics = {}
+
+
+    async def read_MongoDB(self, collection_name:str, agenda:bool, topic_id:str, document_id:str):
+        if agenda:
+            return {"agenda": self.agenda}
+        return self.topics.get(topic_id)
+
+
+    async def read_glossary(self):
+        return {"glossary": [dict(entry) for entry in self.glossary]}
+
+
+    async def update_topic_minutes(self, update_list:dict, create_topic:bool, topic_id:str, topic_title:str, sentence_order:list = None):
+        if create_topic:
+            self.topics[topic_id] = {"topicID": topic_id, "topicTitle": topic_title, "sentences": []}
+        topic = self.topics[topic_id]
+        sentences = {sentence['sentenceID']: sentence['sentenceText'] for sentence in topic['sentences']}
+        sentences.update(update_list)
+        order = sentence_order if sentence_order != None else list(sentences.keys())
+        topic['topicTitle'] = topic_title
+        topic['sentences'] = [{"sentenceID": sentence_id, "sentenceText": sentences[sentence_id]} for sentence_id in order if sentences.get(sentence_id) != None]
+        return {"status": 200}
+
+
+    async def update_topic_verdicts(self, topic_id:str, verdicts:dict, input_hash:str):
+        self.topics[topic_id].update({"verdicts": verdicts, "verdictHash": input_hash})
+        return {"status": 200}
+
+
+
+async def GlossaryVerdictTest():
+    """
+    Stored tracker verdicts must not outlive the glossary they were resolved against:
+    /track_minutes with unchanged minutes reuses the stored verdicts, but after the glossary entry changes the abbreviation verdict follows it.
+    Capitalised words that only spell an abbreviation (FALSE_DEFINITIONS) must not be accepted as its meaning.
+    Uses an in memory chroma client, an offline hashing embedding and a fake chat server for TopicTracker and AgendaTracker
+
+    Returns:
+        True if every check passed
+    """
+    server = FakeChatServer(latency_ms=0)
+    await server.start()
+    chromaDBManager.chromaClient = chromadb.EphemeralClient()
+    chromaDBManager.embeddingFunction = HashingEmbeddingFunction()
+    chromaDBManager.invalidateCollection()
+    mongoDB = InMemoryMinutes(["Vendor review"], [{"abbreviation": "SLA", "meaning": "Service Level Agreement"}])
+    minutes = "Vendor renewal is due in May.\nSLA breaches are reported monthly."
+
+    try:
+        first = await track_minutes(minutes, "Vendor review", "0", "glossary_verdict_test", mongoDB, "SLA")
+        calls = server.calls
+        repeated = await track_minutes(minutes, "Vendor review", "0", "glossary_verdict_test", mongoDB, "SLA")
+        reused = server.calls == calls
+
+        mongoDB.glossary = [{"abbreviation": "SLA", "meaning": "Supplier Liability Addendum"}]
+        updated = await track_minutes(minutes, "Vendor review", "0", "glossary_verdict_test", mongoDB, "SLA")
+    finally:
+        chromaDBManager.chromaClient.delete_collection("glossary_verdict_test")
+        chromaDBManager.invalidateCollection()
+        await gptManager.closeGPTSession()
+        await server.stop()
+
+    checks = {"first verdict uses the glossary": first['abbreviation'] == "SLA: Service Level Agreement",
+              "unchanged input reuses the stored verdicts": reused and repeated == first,
+              "glossary update gives a new verdict": updated['abbreviation'] == "SLA: Supplier Liability Addendum"}
+    min_score = float(os.environ.get('GLOSSARY_MIN_SCORE') or 0.85)
+    for abbreviation, text in FALSE_DEFINITIONS:
+        checks[f"{abbreviation} in '{text}' is left to GPT"] = resolveAcronym(abbreviation, text, None, min_score) == (None, None)
+    for check, passed in checks.items():
+        print(f"{'PASS' if passed else 'FAIL'}: {check}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    GlossaryResolutionBenchmark()
+    asyncio.run(GlossaryVerdictTest())
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import asyncio
+import bson
+from pymongo import monitoring
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils.mongoDBManager import MongoDBManager, createMongoClient
+from utils.createMongoDocument import initialiseMongoData
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Counts the commands (round trips) sent to MongoDB
+    """
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+
+async def TopicUpdateBenchmark(topic_length:int = 40, changed_sentences:tuple = (1, 5, 10, 20, 40), repeats:int = 20):
+    """
+    Round trips and latency of update_topic_minutes on an existing topic for a growing number of changed sentences
+
+    Args:
+        topic_length (int): number of sentences in the topic
+        changed_sentences (tuple): number of sentences changed per update
+        repeats (int): number of updates averaged per data point
+
+    Returns:
+        list of dictionary in the format {changed: int, round_trips: float, ms: float}
+    """
+    counter = CommandCounter()
+    monitoring.register(counter)
+    client = createMongoClient()
+    document_ids = await initialiseMongoData(client)
+    mongo = MongoDBManager(document_ids["minutesID"], document_ids["chatHistoryID"], client)
+
+    topic = {'0' + str(i): f"bulletpoint {i}" for i in range(topic_length)}
+    await mongo.update_topic_minutes(topic, True, '0', 'benchmark topic')
+
+    results = []
+    try:
+        for changed in changed_sentences:
+            counter.count = 0
+            start = time.perf_counter()
+            for repeat in range(repeats):
+                update_dict = {'0' + str(i): f"bulletpoint {i} edit {repeat}" for i in range(changed)}
+                await mongo.update_topic_minutes(update_dict, False, '0', 'benchmark topic')
+            elapsed = time.perf_counter() - start
+
+            result = {"changed": changed,
+                      "round_trips": counter.count / repeats,
+                      "ms": round(elapsed * 1000 / repeats, 2)}
+            print(result)
+            results.append(result)
+
+    finally:
+        await mongo.delete_document(document_ids["minutesID"], 'minutes')
+        await mongo.delete_document(document_ids["chatHistoryID"], 'chatHistory')
+        client.close()
+
+    return results
+
+
+async def ChatHistoryReadBenchmark(turns:int = 5000, last_n:int = 3, repeats:int = 20):
+    """
+    Latency and bytes transferred by a full chat history read against a last_n read, on a long session.
+    A window longer than the history returns every turn, and a missing history reads as an empty list
+
+    Args:
+        turns (int): number of turns in the chat history
+        last_n (int): window requested by the sliced read
+        repeats (int): number of reads averaged per data point
+
+    Returns:
+        list of dictionary in the format {last_n: int or None, turns_returned: int, bytes: int, ms: float}
+    """
+    client = createMongoClient()
+    document_ids = await initialiseMongoData(client)
+    mongo = MongoDBManager(document_ids["minutesID"], document_ids["chatHistoryID"], client)
+
+    history = [{'user': f"question {i} about the meeting minutes",
+                'assistant': f"answer {i} " + "lorem ipsum " * 40,
+                'sourcetopicIDs': ['0', '1']} for i in range(turns)]
+    await mongo.database.chatHistory.update_one({'_id': mongo.chatHistoryID}, {'$push': {'document': {'$each': history}}})
+
+    results = []
+    try:
+        for window in [None, last_n, turns + 10]:
+            start = time.perf_counter()
+            for repeat in range(repeats):
+                chat_history = await mongo.read_MongoDB('chatHistory', False, None, 'document', window)
+            elapsed = time.perf_counter() - start
+
+            result = {"last_n": window,
+                      "turns_returned": len(chat_history['document']),
+                      "bytes": len(bson.encode(chat_history)),
+                      "ms": round(elapsed * 1000 / repeats, 2)}
+            print(result)
+            results.append(result)
+            assert result["turns_returned"] == (turns if window == None else min(window, turns))
+
+        await mongo.database.chatHistory.update_one({'_id': mongo.chatHistoryID}, {'$unset': {'web': ""}})
+        assert (await mongo.read_MongoDB('chatHistory', False, None, 'web', last_n))['web'] == []
+
+    finally:
+        await mongo.delete_document(document_ids["minutesID"], 'minutes')
+        await mongo.delete_document(document_ids["chatHistoryID"], 'chatHistory')
+        client.close()
+
+    return results
+
+
+async def ChatHistoryWriteBenchmark(turns:int = 5000, cap:int = 50, checkpoints:tuple = (100, 1000, 2500, 5000), repeats:int = 20):
+    """
+    Chat history document size and update_chat_history latency as the history grows, unbounded against CHAT_HISTORY_CAP
+
+    Args:
+        turns (int): number of turns appended
+        cap (int): CHAT_HISTORY_CAP of the capped run
+        checkpoints (tuple): history lengths at which size and latency are measured
+        repeats (int): number of appends averaged per checkpoint
+
+    Returns:
+        list of dictionary in the format {cap: int or None, turns: int, document_bytes: int, ms: float}
+    """
+    client = createMongoClient()
+    results = []
+    for run_cap in [None, cap]:
+        if run_cap == None:
+            os.environ.pop('CHAT_HISTORY_CAP', None)
+        else:
+            os.environ['CHAT_HISTORY_CAP'] = str(run_cap)
+        document_ids = await initialiseMongoData(client)
+        mongo = MongoDBManager(document_ids["minutesID"], document_ids["chatHistoryID"], client)
+        turn = {'user': "question about the meeting minutes", 'assistant': "answer " + "lorem ipsum " * 40, 'sourcetopicIDs': ['0', '1']}
+
+        try:
+            appended = 0
+            for checkpoint in checkpoints:
+                while appended < checkpoint - repeats:
+                    await mongo.update_chat_history(dict(turn), 'document')
+                    appended += 1
+
+                start = time.perf_counter()
+                for repeat in range(repeats):
+                    await mongo.update_chat_history(dict(turn), 'document')
+                elapsed = time.perf_counter() - start
+                appended += repeats
+
+                document = await mongo.database.chatHistory.find_one({'_id': mongo.chatHistoryID})
+                result = {"cap": run_cap,
+                          "turns": appended,
+                          "document_bytes": len(bson.encode(document)),
+                          "ms": round(elapsed * 1000 / repeats, 2)}
+                print(result)
+                results.append(result)
+
+            # concurrent appends race on the trim and are retried, no turn may be lost or read twice
+            if run_cap != None:
+                await asyncio.gather(*[mongo.update_chat_history({**turn, 'user': f"concurrent {i}"}, 'document') for i in range(repeats)])
+                appended += repeats
+
+            # the archive and the document together still hold every turn
+            full_history = await mongo.read_full_chat_history('document')
+            assert len(full_history) == appended
+            assert len([t for t in full_history if t['user'].startswith("concurrent")]) == (repeats if run_cap != None else 0)
+
+        finally:
+            await mongo.delete_document(document_ids["minutesID"], 'minutes')
+            await mongo.delete_document(document_ids["chatHistoryID"], 'chatHistory')
+
+    os.environ.pop('CHAT_HISTORY_CAP', None)
+    client.close()
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(TopicUpdateBenchmark())
+    asyncio.run(ChatHistoryReadBenchmark())
+    asyncio.run(ChatHistoryWriteBenchmark())
@@ -1,13 +1,14 @@
 import asyncio
 import datetime
-from src.utils.mongoDBManager import MongoDBManager
+from src.utils.mongoDBManager import MongoDBManager, createMongoClient
 from src.utils.createMongoDocument import initialiseMongoData
 
 async def MongoDBTest():
 
-    document_ids = initialiseMongoData()
+    client = createMongoClient()
+    document_ids = await initialiseMongoData(client)
 
-    mongo = MongoDBManager(document_ids["minutesID"], document_ids["chatHistoryID"])
+    mongo = MongoDBManager(document_ids["minutesID"], document_ids["chatHistoryID"], client)
     new_data_agenda = ['create design system', 'create web experiment']
     new_data_meeting_details = {
         "date": datetime.datetime.now(),
@@ -32,16 +33,16 @@ async def MongoDBTest():
         await mongo.update_chat_history({'user': "what about this?",'assistant': "The topic is about ..."}, 'document')
         await mongo.update_chat_history({'user': "what is 1+1",'assistant': "3"}, 'web')
 
-        mongo.read_MongoDB('minutes', True, None, None)
-        mongo.read_MongoDB('minutes', False, '0', None)
-        mongo.read_MongoDB('chatHistory', False, None, 'document')
-        mongo.read_MongoDB('chatHistory', False, None, 'web')
+        await mongo.read_MongoDB('minutes', True, None, None)
+        await mongo.read_MongoDB('minutes', False, '0', None)
+        await mongo.read_MongoDB('chatHistory', False, None, 'document')
+        await mongo.read_MongoDB('chatHistory', False, None, 'web')
 
         await mongo.clear_chat_history('web')
-        mongo.read_MongoDB('chatHistory', False, None, 'web')
+        await mongo.read_MongoDB('chatHistory', False, None, 'web')
 
         await mongo.delete_topic('0')
-        mongo.read_MongoDB('minutes', False, '0', None)
+        await mongo.read_MongoDB('minutes', False, '0', None)
 
         await mongo.delete_document(document_ids["minutesID"], 'minutes')
 
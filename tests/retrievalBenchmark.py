@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import asyncio
+import chromadb
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils import chromaDBManager
+from utils.chromaDBManager import ChromaDBManager
+from utils.bm25Index import invalidateBM25Index
+from trackerBenchmark import HashingEmbeddingFunction
+from contextBenchmark import fixtureMeeting, FIXTURE_TOPICS
+
+
+# (topic title, fact written into the topic, question about it)
+RETRIEVAL_FACTS = [
+    ("Budget", "We decided the Q3 budget stays at 40k with no new tooling.", "what did we decide about the Q3 budget"),
+    ("Budget", "Payroll savings from the contractor cut go to the audit reserve.", "where do the payroll savings go"),
+    ("Hiring", "The offer to the senior engineer candidate expires on Friday.", "When does the offer to the senior engineer expire?"),
+    ("Hiring", "Referral bonuses rise to 3k for backend roles from April.", "how much is the referral bonus for backend roles"),
+    ("Release", "The hotfix for the payment bug ships in version 2.3.1.", "Which version ships the payment bug hotfix?"),
+    ("Release", "Feature flag cleanup is added to the release checklist.", "is feature flag cleanup on the release checklist"),
+    ("Infrastructure", "The database migration to the new cluster is scheduled for Sunday night.", "When is the database migration scheduled?"),
+    ("Infrastructure", "DNS failover testing moves to the Tokyo region next month.", "where does dns failover testing move"),
+    ("Marketing", "The product launch webinar is capped at 500 attendees.", "attendee cap for the launch webinar"),
+    ("Operations", "The cleaning vendor contract renews automatically in July.", "When does the cleaning vendor contract renew?"),
+]
+
+
+class LatencyEmbeddingFunction(HashingEmbeddingFunction):
+
+    def __init__(self, latency_ms:float = 0, **kwargs):
+        """
+        Hashing embedding that waits like a round trip to the OpenAI embedding endpoint before answering
+        """
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+
+
+    def __call__(self, texts):
+        time.sleep(self.latency_ms / 1000)
+        return super().__call__(texts)
+
+
+
+async def loadFixtureCorpus(sentences_per_topic:int = 150):
+    """
+    Write the fixture meeting with RETRIEVAL_FACTS spread through its topics into an in memory chroma collection
+
+    Returns:
+        tuple of (ChromaDBManager, LatencyEmbeddingFunction used by the collection)
+    """
+    embedding = LatencyEmbeddingFunction()
+    chromaDBManager.chromaClient = chromadb.EphemeralClient()
+    chromaDBManager.embeddingFunction = embedding
+    chromaDBManager.invalidateCollection()
+    invalidateBM25Index()
+    if 'retrieval_benchmark' in [collection.name for collection in chromaDBManager.chromaClient.list_collections()]:
+        chromaDBManager.chromaClient.delete_collection('retrieval_benchmark')
+    # the hashing embedding has many ties, a wider HNSW search keeps the vector ranking exact
+    chromaDBManager.chromaClient.create_collection('retrieval_benchmark', metadata={"hnsw:search_ef": 200})
+    chromaDB = ChromaDBManager('retrieval_benchmark')
+
+    titles = [title for title, words in FIXTURE_TOPICS]
+    meeting = fixtureMeeting(sentences_per_topic)
+    for fact_index, (title, fact, question) in enumerate(RETRIEVAL_FACTS):
+        meeting[f"topic{titles.index(title)}"][1][(fact_index * 37) % sentences_per_topic] = fact
+    for topic_id, (title, sentences) in meeting.items():
+        sentence_ids = [f"{topic_id}-{i}" for i in range(len(sentences))]
+        await chromaDB.update_embeddings(dict(zip(sentence_ids, sentences)), topic_id, title, sentence_ids)
+    return chromaDB, embedding
+
+
+
+async def RetrievalBenchmark(modes:list = ['vector', 'lexical', 'hybrid'], k:int = 3, embedding_latency_ms:float = 150):
+    """
+    Recall@k and latency of query_collection for vector, lexical (BM25) and hybrid retrieval over the fixture corpus.
+    Recall@k counts the questions whose fact is one of the k hits (window 0 keeps only the hit sentences in the context).
+    The hashing embedding is itself a bag of words, so the vector recall here is closer to BM25 than ada-002 would be
+
+    Args:
+        modes (list): retrieval modes compared
+        k (int): number of hits
+        embedding_latency_ms (float): delay of every query embedding, the OpenAI round trip lexical retrieval avoids
+
+    Returns:
+        dictionary in the format {mode: {...}}
+    """
+    chromaDB, embedding = await loadFixtureCorpus()
+    embedding.latency_ms = embedding_latency_ms
+
+    # first lexical search builds the index from chroma, later writes keep it in step
+    start = time.perf_counter()
+    chromaDB.lexical_index()
+    print(f"BM25 bootstrap of {len(chromaDB.lexical_index())} sentences: {round((time.perf_counter() - start) * 1000, 1)} ms")
+    embedding.latency_ms = 0
+    await chromaDB.update_embeddings({"topic0-150": "Catering for the offsite moves to the rooftop terrace."}, "topic0", "Budget", None)
+    incremental = [hit[0] for hit in chromaDB.lexical_hits("rooftop terrace catering", 1)] == ["topic0-150"]
+    print(f"incremental update found by lexical search: {incremental}")
+    embedding.latency_ms = embedding_latency_ms
+
+    results = {}
+    for mode in modes:
+        found = 0
+        latencies = []
+        for title, fact, question in RETRIEVAL_FACTS:
+            start = time.perf_counter()
+            unique_parent_topics, context_dict = await chromaDB.query_collection(question, k, window=0, retrieval=mode)
+            latencies.append(time.perf_counter() - start)
+            found += any(fact in text for text in context_dict.values())
+
+        results[mode] = {f"recall@{k}": round(found / len(RETRIEVAL_FACTS), 2),
+                         "mean_latency_ms": round(1000 * sum(latencies) / len(latencies), 1),
+                         "p95_latency_ms": round(1000 * sorted(latencies)[int(0.95 * (len(latencies) - 1))], 1)}
+        print(mode, results[mode])
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(RetrievalBenchmark())
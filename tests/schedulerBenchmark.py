@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils.requestScheduler import SingleFlightScheduler, finishUninterrupted
+
+
+class UpstreamCounter():
+
+    def __init__(self, gpt_latency_ms:float = 600, embedding_latency_ms:float = 150):
+        """
+        Imitates track_minutes: three GPT trackers running next to an embedding + database write, and counts upstream calls
+
+        Args:
+            gpt_latency_ms (float): latency of one GPT call
+            embedding_latency_ms (float): latency of the embedding / database write
+        """
+        self.gpt_latency = gpt_latency_ms / 1000
+        self.embedding_latency = embedding_latency_ms / 1000
+        self.gpt_calls = 0
+        self.embedding_calls = 0
+
+
+    async def gpt(self):
+        self.gpt_calls += 1
+        await asyncio.sleep(self.gpt_latency)
+        return True
+
+
+    async def write(self):
+        self.embedding_calls += 1
+        await asyncio.sleep(self.embedding_latency)
+        return {'status': 200}
+
+
+    async def track_minutes(self, minutes:str):
+        writes = asyncio.ensure_future(self.write())
+        try:
+            results = await asyncio.gather(self.gpt(), self.gpt(), self.gpt())
+        finally:
+            await finishUninterrupted(writes)
+        return {"minutes": minutes, "topic": results[0]}
+
+
+
+async def TypingSessionBenchmark(keystrokes:int = 40, keystroke_interval_ms:float = 120, pause_every:int = 10, pause_ms:float = 1500):
+    """
+    Replay a typing session on one topic, where the editor calls /track_minutes on every keystroke with short pauses in between,
+    and count the upstream GPT / embedding calls with and without the scheduler
+
+    Args:
+        keystrokes (int): number of /track_minutes calls
+        keystroke_interval_ms (float): time between keystrokes
+        pause_every (int): the user pauses after this many keystrokes
+        pause_ms (float): length of the pause
+
+    Returns:
+        dictionary in the format {direct: {...}, scheduled: {...}}
+    """
+    results = {}
+    for mode in ['direct', 'scheduled']:
+        upstream = UpstreamCounter()
+        scheduler = SingleFlightScheduler()
+        start = time.perf_counter()
+        calls = []
+        text = ''
+        for i in range(keystrokes):
+            text += 'a'
+            minutes = text
+            if mode == 'direct':
+                calls.append(asyncio.ensure_future(upstream.track_minutes(minutes)))
+            else:
+                calls.append(asyncio.ensure_future(scheduler.submit(('minutesID', '0'), lambda minutes=minutes: upstream.track_minutes(minutes))))
+            await asyncio.sleep((pause_ms if (i + 1) % pause_every == 0 else keystroke_interval_ms) / 1000)
+
+        responses = await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - start
+
+        results[mode] = {"requests": keystrokes,
+                         "gpt_calls": upstream.gpt_calls,
+                         "embedding_calls": upstream.embedding_calls,
+                         "last_response_is_newest": responses[-1]["minutes"] == text,
+                         "seconds": round(elapsed, 2)}
+        if mode == 'scheduled':
+            results[mode]["scheduler"] = scheduler.stats()
+        print(mode, results[mode])
+
+    reduction = 1 - results['scheduled']['gpt_calls'] / results['direct']['gpt_calls']
+    print(f"upstream GPT call reduction: {reduction:.1%}")
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(TypingSessionBenchmark())
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import openai
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+from utils import gptManager
+
+
+class FakeStreamingServer():
+
+    def __init__(self, tokens:int = 300, token_interval_ms:float = 5, first_token_ms:float = 200, port:int = 8765) -> None:
+        """
+        Local server imitating the openai chat completion streaming endpoint
+
+        Args:
+            tokens (int): number of tokens streamed per answer
+            token_interval_ms (float): delay between tokens, the "model speed"
+            first_token_ms (float): delay before the first token
+            port (int): port the server listens to
+        """
+        self.tokens = tokens
+        self.token_interval_ms = token_interval_ms
+        self.first_token_ms = first_token_ms
+        self.port = port
+        self.runner = None
+
+
+    async def handler(self, request):
+        await request.json()
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(self.first_token_ms / 1000)
+
+        chunk = {'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        for i in range(self.tokens):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': f" tok{i}"}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.token_interval_ms / 1000)
+
+        chunk = {'choices': [{'index': 0, 'delta': {}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+        openai.api_base = f"http://127.0.0.1:{self.port}/v1"
+
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+
+async def StreamBenchmark(coalesce_chars:int = 0, coalesce_ms:int = 0, tokens:int = 300):
+    """
+    Time to first token and tokens/sec delivered by streamGPTQuery for the given coalescing window
+
+    Args:
+        coalesce_chars (int): size window passed to streamGPTQuery
+        coalesce_ms (int): time window passed to streamGPTQuery
+        tokens (int): number of tokens the fake server streams
+
+    Returns:
+        dictionary in the format {time_to_first_token_ms: float, tokens_per_sec: float, events: int, seconds: float}
+    """
+    start = time.perf_counter()
+    response = await gptManager.streamGPTQuery([{'role': 'user', 'content': 'benchmark'}], user_query='benchmark', type='web',
+                                               coalesce_chars=coalesce_chars, coalesce_ms=coalesce_ms)
+    first_event = None
+    events = 0
+    async for event in response.body_iterator:
+        if first_event == None:
+            first_event = time.perf_counter()
+        events += 1
+    elapsed = time.perf_counter() - start
+
+    result = {"coalesce_chars": coalesce_chars,
+              "coalesce_ms": coalesce_ms,
+              "time_to_first_token_ms": round((first_event - start) * 1000, 1),
+              "tokens_per_sec": round(tokens / elapsed, 1),
+              "events": events,
+              "seconds": round(elapsed, 3)}
+    print(result)
+    return result
+
+
+async def benchmark():
+    server = FakeStreamingServer()
+    await server.start()
+    try:
+        await StreamBenchmark()
+        await StreamBenchmark(coalesce_chars=32)
+        await StreamBenchmark(coalesce_ms=50)
+    finally:
+        await gptManager.closeGPTSession()
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
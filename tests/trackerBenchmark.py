@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import numpy as np
+import openai
+from aiohttp import web
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+from utils import gptManager, chromaDBManager
+from utils.embeddingCache import EmbeddingCache, CachedEmbeddingFunction
+
+
+# (topic title, existing minutes, new sentence, new sentence belongs to the topic)
+FIXTURE_MINUTES = [
+    ("Budget", ["The marketing budget for next quarter is 20k.", "Finance wants the budget split across three campaigns.",
+                "The budget review with finance is on Friday.", "Campaign spending was over budget last quarter."],
+     "Finance will cut the campaign budget by 10 percent.", True),
+    ("Budget", ["The marketing budget for next quarter is 20k.", "Finance wants the budget split across three campaigns.",
+                "The budget review with finance is on Friday.", "Campaign spending was over budget last quarter."],
+     "The office printer on level 3 is broken again.", False),
+    ("Hiring", ["We are hiring two backend engineers.", "Interviews for the engineers start next week.",
+                "The hiring panel needs one more interviewer.", "Recruiters have shortlisted ten engineers."],
+     "The panel will interview the shortlisted engineers on Monday.", True),
+    ("Hiring", ["We are hiring two backend engineers.", "Interviews for the engineers start next week.",
+                "The hiring panel needs one more interviewer.", "Recruiters have shortlisted ten engineers."],
+     "Lunch catering for the offsite is confirmed.", False),
+    ("Release", ["Version 2.1 release is planned for March.", "The release needs the login bug fixed first.",
+                 "QA will test the release candidate this week.", "The login bug fix is in review."],
+     "Marketing wants release notes for the login changes.", True),
+    ("Release", ["Version 2.1 release is planned for March.", "The release needs the login bug fixed first.",
+                 "QA will test the release candidate this week.", "The login bug fix is in review."],
+     "Finance asked about the hiring budget for engineers.", False),
+]
+
+
+class HashingEmbeddingFunction():
+
+    def __init__(self, dimension:int = 512):
+        """
+        Offline stand in for the OpenAI embedding model, a hashed bag of words so that sentences sharing words are similar
+        """
+        self.dimension = dimension
+        self.calls = 0
+
+
+    def __call__(self, texts):
+        self.calls += 1
+        embeddings = []
+        for text in texts:
+            vector = np.full(self.dimension, 0.05, dtype=np.float32)
+            for word in text.lower().strip('.').split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1
+            embeddings.append(vector.tolist())
+        return embeddings
+
+
+
+class FakeChatServer():
+
+    def __init__(self, latency_ms:float = 600, port:int = 8766):
+        """
+        Local server imitating the openai chat completion endpoint, always answers True and counts the calls
+        """
+        self.latency_ms = latency_ms
+        self.port = port
+        self.calls = 0
+        self.runner = None
+
+
+    async def handler(self, request):
+        await request.json()
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        return web.json_response({'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'True'}}]})
+
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+        openai.api_base = f"http://127.0.0.1:{self.port}/v1"
+
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+
+async def TopicTrackerBenchmark(lower:float = 0.5, upper:float = 0.56, rounds:int = 5):
+    """
+    Latency and LLM call rate of TopicTracker in llm and vector mode over the fixture minutes.
+    Uses an offline hashing embedding and a fake chat server, the default band is tuned for the hashing embedding and not for ada-002
+
+    Args:
+        lower (float): TOPIC_TRACKER_LOWER used in vector mode
+        upper (float): TOPIC_TRACKER_UPPER used in vector mode
+        rounds (int): number of passes over the fixture, later passes hit the embedding cache
+
+    Returns:
+        dictionary in the format {llm: {...}, vector: {...}}
+    """
+    server = FakeChatServer()
+    await server.start()
+    embedding = HashingEmbeddingFunction()
+    chromaDBManager.embeddingFunction = CachedEmbeddingFunction(embedding, EmbeddingCache('benchmark'))
+    os.environ['TOPIC_TRACKER_LOWER'] = str(lower)
+    os.environ['TOPIC_TRACKER_UPPER'] = str(upper)
+
+    results = {}
+    try:
+        for mode in ['llm', 'vector']:
+            os.environ['TOPIC_TRACKER_MODE'] = mode
+            server.calls = 0
+            latencies = []
+            for _ in range(rounds):
+                for title, sentences, new_sentence, label in FIXTURE_MINUTES:
+                    minutes = "\n".join(sentences + [new_sentence])
+                    start = time.perf_counter()
+                    await gptManager.TopicTracker(minutes, title, [new_sentence])
+                    latencies.append(time.perf_counter() - start)
+
+            total = rounds * len(FIXTURE_MINUTES)
+            results[mode] = {"calls": total,
+                             "llm_calls": server.calls,
+                             "llm_call_rate": round(server.calls / total, 3),
+                             "mean_latency_ms": round(1000 * sum(latencies) / total, 1),
+                             "p95_latency_ms": round(1000 * sorted(latencies)[int(0.95 * (total - 1))], 1)}
+            print(mode, results[mode])
+        print("embedding calls", embedding.calls, gptManager.trackerDecisionStats())
+    finally:
+        await gptManager.closeGPTSession()
+        await server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(TopicTrackerBenchmark())